@@ -0,0 +1,130 @@
+import heapq
+import time
+from phone_queue import QueueEntry
+
+# Ключ служебного значения в хранилище: номера в работе переживают перезапуск
+META_KEY = 'assignments'
+
+class Assignment:
+    """Номер, взятый администратором в обработку"""
+
+    __slots__ = ('admin_id', 'entry', 'taken_at', 'deadline', 'photo_sent')
+
+    def __init__(self, admin_id: int, entry: QueueEntry, deadline: float):
+        self.admin_id = admin_id
+        self.entry = entry
+        self.taken_at = time.time()
+        self.deadline = deadline  # Срок аренды: после него номер забирается у админа
+        self.photo_sent = False  # Фото отправлено, ждем статус от пользователя
+
+    @property
+    def user_id(self) -> int:
+        return self.entry.user_id
+
+    def to_dict(self) -> dict:
+        entry = self.entry
+        return {
+            'admin_id': self.admin_id,
+            'user_id': entry.user_id,
+            'username': entry.username,
+            'phone': entry.phone,
+            'timestamp': entry.timestamp,
+            'taken_at': self.taken_at,
+            'deadline': self.deadline,
+            'photo_sent': self.photo_sent
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Assignment':
+        entry = QueueEntry(data['user_id'], data['username'], data['phone'], data['timestamp'])
+        assignment = cls(data['admin_id'], entry, data['deadline'])
+        assignment.taken_at = data['taken_at']
+        assignment.photo_sent = data['photo_sent']
+        return assignment
+
+class AssignmentTable:
+    """Номера в работе: у каждого администратора не больше одного номера.
+
+    Каждая запись арендуется до срока; сроки хранятся в куче, просроченные
+    записи извлекаются за O(log n) без отдельного таймера на каждую.
+    """
+
+    def __init__(self):
+        self._by_admin = {}  # admin_id -> Assignment
+        self._by_user = {}  # user_id -> Assignment
+        self._deadlines = []  # Куча (срок, user_id); устаревшие элементы отбрасываются при извлечении
+
+    def __len__(self):
+        return len(self._by_admin)
+
+    def __iter__(self):
+        return iter(list(self._by_admin.values()))
+
+    def assign(self, admin_id: int, entry: QueueEntry, timeout: float) -> Assignment:
+        if admin_id in self._by_admin:
+            raise ValueError(f"Администратор {admin_id} уже обрабатывает номер")
+        if entry.user_id in self._by_user:
+            raise ValueError(f"Номер пользователя {entry.user_id} уже в обработке")
+        return self._add(Assignment(admin_id, entry, time.time() + timeout))
+
+    def restore(self, items):
+        """Восстановление номеров в работе из снимка dump(); истекшие сроки снимет планировщик"""
+        for data in items:
+            if data['admin_id'] not in self._by_admin and data['user_id'] not in self._by_user:
+                self._add(Assignment.from_dict(data))
+
+    def dump(self) -> list:
+        """Снимок для хранилища"""
+        return [assignment.to_dict() for assignment in self._by_admin.values()]
+
+    def _add(self, assignment: Assignment) -> Assignment:
+        self._by_admin[assignment.admin_id] = assignment
+        self._by_user[assignment.user_id] = assignment
+        heapq.heappush(self._deadlines, (assignment.deadline, assignment.user_id))
+        return assignment
+
+    def renew(self, assignment: Assignment, timeout: float):
+        """Продление аренды с новым сроком"""
+        assignment.deadline = time.time() + timeout
+        heapq.heappush(self._deadlines, (assignment.deadline, assignment.user_id))
+
+    def next_deadline(self):
+        """Ближайший срок аренды или None"""
+        while self._deadlines:
+            deadline, user_id = self._deadlines[0]
+            assignment = self._by_user.get(user_id)
+            if assignment is not None and assignment.deadline == deadline:
+                return deadline
+            heapq.heappop(self._deadlines)
+        return None
+
+    def pop_expired(self, now: float = None):
+        """Снятие с обработки всех записей с истекшим сроком"""
+        now = time.time() if now is None else now
+        expired = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return expired
+            _, user_id = heapq.heappop(self._deadlines)
+            expired.append(self.release_user(user_id))
+
+    def by_admin(self, admin_id: int):
+        return self._by_admin.get(admin_id)
+
+    def by_user(self, user_id: int):
+        return self._by_user.get(user_id)
+
+    def is_busy(self, admin_id: int) -> bool:
+        return admin_id in self._by_admin
+
+    def idle_admins(self, admin_ids):
+        """Администраторы без номера в работе, в исходном порядке"""
+        return [admin_id for admin_id in admin_ids if admin_id not in self._by_admin]
+
+    def release_user(self, user_id: int):
+        """Снятие номера пользователя с обработки; возвращает Assignment или None"""
+        assignment = self._by_user.pop(user_id, None)
+        if assignment is not None:
+            del self._by_admin[assignment.admin_id]
+        return assignment
@@ -0,0 +1,214 @@
+"""Нагрузочный прогон Bot из bot.py против локальной заглушки Bot API.
+
+Поток синтетических обновлений (/start, сдача номеров, пропуск и взятие номера,
+фото, статус, /check, /call) подается с заданной скоростью; в конце печатаются
+пропускная способность, задержки обработчиков (p50/p99), число запросов
+к Bot API и пиковая память процесса.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_bot.py --users 300 --admins 5 --rate 200 --latency 0.02
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_bot_api import FakeBotAPI
+
+BOT_TOKEN = '123456:BENCH'
+FIRST_ADMIN_ID = 1
+FIRST_USER_ID = 100000
+
+_ids = itertools.count(1)
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': 'bench', 'username': f'bench{user_id}'}
+
+def _message(user_id: int, **extra) -> dict:
+    return {
+        'message_id': next(_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+        **extra
+    }
+
+def text_update(user_id: int, text: str) -> dict:
+    extra = {'text': text}
+    if text.startswith('/'):
+        extra['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_ids), 'message': _message(user_id, **extra)}
+
+def photo_update(user_id: int) -> dict:
+    photo = [{'file_id': 'bench_photo', 'file_unique_id': 'bench_photo', 'width': 1, 'height': 1}]
+    return {'update_id': next(_ids), 'message': _message(user_id, photo=photo)}
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {'update_id': next(_ids), 'callback_query': {
+        'id': str(next(_ids)), 'from': _user(user_id), 'chat_instance': 'bench', 'data': data,
+        'message': _message(user_id, text='bench')
+    }}
+
+def admin_stream(admin_id: int, user_ids, check_every: int, skip_share=0.0, seed=1):
+    """Сдача номеров пользователями и их обработка одним админом, строго по порядку.
+
+    Доля skip_share номеров сначала пропускается и только потом берется в работу.
+    """
+    rng = random.Random(seed)
+    for i, user_id in enumerate(user_ids):
+        yield text_update(user_id, '/start')
+        yield callback_update(user_id, 'add_phone')
+        yield text_update(user_id, f'+7 9{user_id % 10 ** 9:09d}')
+        if rng.random() < skip_share:
+            yield callback_update(admin_id, f'skip_phone_{user_id}')
+        yield callback_update(admin_id, f'take_phone_{user_id}')
+        yield photo_update(admin_id)
+        yield callback_update(user_id, f'status_success_{user_id}')
+        if check_every and (i + 1) % check_every == 0:
+            yield text_update(admin_id, '/check')
+
+def browse_stream(user_id: int):
+    """Пользователь открывает меню и мануалы, не сдавая номер"""
+    yield text_update(user_id, '/start')
+    yield callback_update(user_id, 'manuals')
+    yield callback_update(user_id, 'back_to_main')
+
+class Pacer:
+    """Общий темп подачи обновлений: не больше rate в секунду на все потоки"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(self._next, now)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux - килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def replay(bot, streams, pacer: Pacer, latencies: list):
+    """Потоки идут параллельно, обновления внутри потока - по одному, как от живого пользователя"""
+    from telegram import Update
+    app = bot.app
+
+    async def run(stream):
+        for data in stream:
+            await pacer.wait()
+            update = Update.de_json(data, app.bot)
+            started = time.perf_counter()
+            await app.update_processor.process_update(update, app.process_update(update))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(run(stream) for stream in streams))
+
+async def main(args):
+    api = FakeBotAPI(latency=args.latency, rate_429=args.rate_429, seed=1)
+    await api.start()
+    admin_ids = list(range(FIRST_ADMIN_ID, FIRST_ADMIN_ID + args.admins))
+    os.environ.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'ADMIN_IDS': ','.join(map(str, admin_ids)),
+        'BOT_API_BASE_URL': api.base_url,
+        'STORAGE_BACKEND': args.backend,
+    })
+    # bot.py читает настройки при импорте, поэтому импортируем после подготовки окружения
+    import bot as bot_module
+    from metrics import HANDLER_SECONDS
+    # Журнал каждого HTTP-запроса искажает замеры
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    bot = bot_module.Bot()
+    app = bot.app
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    rss_before = peak_rss_mb()
+
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    streams = [
+        admin_stream(admin_id, user_ids[i::args.admins], args.check_every, args.skip_share, seed=admin_id)
+        for i, admin_id in enumerate(admin_ids)
+    ]
+    streams.extend(browse_stream(FIRST_USER_ID + args.users + i) for i in range(args.browsers))
+    latencies = []
+    started = time.perf_counter()
+    await replay(bot, streams, Pacer(args.rate), latencies)
+    elapsed = time.perf_counter() - started
+    await bot.storage.flush()
+    flushed = time.perf_counter() - started
+
+    broadcast_time = None
+    if args.call:
+        sent_before = api.count('sendMessage')
+        started = time.perf_counter()
+        await replay(bot, [[text_update(admin_ids[0], '/call Бенчмарк рассылки')]], Pacer(0), [])
+        while bot.broadcaster.is_running():
+            await asyncio.sleep(0.05)
+        broadcast_time = time.perf_counter() - started
+        broadcast_sent = api.count('sendMessage') - sent_before
+
+    await app.stop()
+    await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+    await api.stop()
+
+    print(f"Обновлений: {len(latencies)} за {elapsed:.2f} с ({len(latencies) / elapsed:.0f}/с), "
+          f"сброс на диск: {flushed - elapsed:.2f} с")
+    print(f"Обновление целиком: p50 {percentile(latencies, 0.5) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс")
+    print("Обработчики (по гистограммам метрик):")
+    for labels, histogram in sorted(bot.metrics.histograms(HANDLER_SECONDS), key=lambda row: -row[1].count):
+        print(f"   {labels['handler']:<16} {histogram.count:>6}  p50 {histogram.quantile(0.5) * 1000:6.1f} мс  "
+              f"p99 {histogram.quantile(0.99) * 1000:6.1f} мс")
+    print(f"Запросов к Bot API: {len(api.calls)}, ответов 429: {api.throttled}")
+    if broadcast_time is not None:
+        print(f"Рассылка /call: {broadcast_sent} сообщений за {broadcast_time:.2f} с")
+    print(f"Пиковая память: {peak_rss_mb():.0f} МБ (после запуска бота {rss_before:.0f} МБ)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300, help='пользователей, сдающих номер')
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--browsers', type=int, default=100, help='пользователей, только открывающих меню')
+    parser.add_argument('--rate', type=float, default=200, help='обновлений в секунду, 0 - без ограничения')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа заглушки Bot API, секунды')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля ответов 429 от заглушки')
+    parser.add_argument('--check-every', type=int, default=20, help='/check после каждых N обработанных номеров')
+    parser.add_argument('--skip-share', type=float, default=0.2, help='доля номеров, которые админ сначала пропускает')
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    parser.add_argument('--no-call', dest='call', action='store_false', help='без рассылки /call в конце')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    # Бот пишет в bd/ и читает картинки мануала из assets/ относительно текущего каталога
+    workdir = tempfile.mkdtemp(prefix='bench_bot_')
+    os.symlink(os.path.join(ROOT, 'assets'), os.path.join(workdir, 'assets'))
+    os.chdir(workdir)
+    try:
+        asyncio.run(main(args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
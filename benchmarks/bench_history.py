@@ -0,0 +1,120 @@
+"""Время загрузки, сохранения и построения отчета /check на больших историях, пиковая память.
+
+Для каждого размера генерируется phones_history.json (см. gen_history.py),
+замеры выполняются в отдельном процессе, чтобы пиковая память (RSS)
+относилась только к этому размеру.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_history.py 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gen_history import generate_history
+from utils import save_history
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux - килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def timed(results: dict, name: str, func):
+    started = time.perf_counter()
+    value = func()
+    results[name] = time.perf_counter() - started
+    return value
+
+def build_indexes(storage):
+    """То же, что Bot.load_history_indexes: сводка /check и индекс номеров за один проход"""
+    from phone_index import PhoneIndex
+    from report import HistoryReport
+    report = HistoryReport(lambda user_id: f"ID: {user_id}")
+    index = PhoneIndex(cooldown=86400)
+    for user_id, phone_entry in storage.iter_history():
+        report.add(user_id, phone_entry)
+        index.add(user_id, phone_entry)
+    return report, index
+
+def measure(path: str, backend: str) -> dict:
+    """Замеры для одного файла истории (выполняется в дочернем процессе)"""
+    from storage import JsonStorage, SQLiteStorage
+    from utils import load_history
+    results = {}
+    workdir = os.path.dirname(path)
+    phone_history = timed(results, 'load_history', lambda: load_history(path))
+    timed(results, 'save_history', lambda: save_history(os.path.join(workdir, 'saved.json'), phone_history))
+    del phone_history
+
+    if backend == 'json':
+        storage = JsonStorage(path)
+        timed(results, 'open', storage.open)
+    else:
+        # Первый запуск переносит историю из JSON в SQLite, последующие читают ее из базы
+        storage = SQLiteStorage(os.path.join(workdir, 'bot.sqlite3'), legacy_json=path)
+        timed(results, 'open', storage.open)
+    report, index = timed(results, 'indexes', lambda: build_indexes(storage))
+    storage.close()
+
+    # Треть периода, который покрывает gen_history (год до сегодняшнего дня)
+    date_from = (date.today() - timedelta(days=240)).isoformat()
+    date_to = (date.today() - timedelta(days=120)).isoformat()
+    user_id = max(report.user_ids(), key=lambda uid: report.count(user_id=uid))
+    timed(results, 'check_page', lambda: report.page(0))
+    timed(results, 'check_page_warm', lambda: report.page(0))
+    timed(results, 'check_last_page', lambda: report.page(max(0, report.count() // 40 - 1)))
+    timed(results, 'check_period', lambda: report.page(0, date_from=date_from, date_to=date_to))
+    timed(results, 'check_user', lambda: report.page(0, user_id=user_id))
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+COLUMNS = (
+    ('load_history', 'load_history'),
+    ('save_history', 'save_history'),
+    ('open', 'открытие хранилища'),
+    ('indexes', 'сводка + индекс'),
+    ('check_page', '/check, 1 стр.'),
+    ('check_page_warm', '/check повторно'),
+    ('check_last_page', '/check, посл. стр.'),
+    ('check_period', '/check за период'),
+    ('check_user', '/check по польз.'),
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', type=int, nargs='*', default=DEFAULT_SIZES, help='размеры истории, записей')
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    parser.add_argument('--legacy', type=float, default=0.05, help='доля записей старого формата')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)  # Путь к файлу: режим дочернего процесса
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.backend)))
+        return
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix='bench_history_') as workdir:
+            path = os.path.join(workdir, 'phones_history.json')
+            save_history(path, generate_history(size, legacy_share=args.legacy))
+            file_mb = os.path.getsize(path) / 2 ** 20
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--measure', path, '--backend', args.backend],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results = json.loads(output.strip().splitlines()[-1])
+        print(f"\n{size} записей ({file_mb:.1f} МБ), бэкенд {args.backend}, пиковая память {results['peak_rss_mb']:.0f} МБ")
+        for key, title in COLUMNS:
+            print(f"   {title:<22} {results[key] * 1000:10.1f} мс")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Память на пользователя и на запись истории: прежние словари против UserRecord, HistoryEntry и PhoneRecord.
+
+Запуск из корня репозитория: python benchmarks/bench_memory.py [число пользователей]
+"""
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phone_index import PhoneIndex
+from storage import HistoryEntry, UserRecord
+
+ENTRIES_PER_USER = 3
+
+class NullStorage:
+    """Хранилище-заглушка: бенчмарк измеряет только объекты в памяти"""
+
+    def set_user_data(self, user_id, data):
+        pass
+
+class LegacyUserRecord(dict):
+    """Прежний UserRecord - словарь с привязкой к хранилищу"""
+    __slots__ = ('_storage', '_user_id')
+
+    def __init__(self, storage, user_id, data=()):
+        super().__init__(data)
+        self._storage = storage
+        self._user_id = user_id
+
+class LegacyPhoneRecord:
+    """Прежняя запись индекса номеров со списком всех сдач"""
+    __slots__ = ('submissions', 'pending', 'last_resolved')
+
+    def __init__(self):
+        self.submissions = []
+        self.pending = 0
+        self.last_resolved = None
+
+def make_user_data(user_id: int, rng) -> dict:
+    # Строки собираются заново, как при разборе JSON из хранилища
+    data = {
+        'username': f"user{rng.randrange(10 ** 9)}",
+        'main_menu_message_id': rng.randrange(10 ** 6, 10 ** 7),
+        'queue_message_id': rng.randrange(10 ** 6, 10 ** 7),
+    }
+    if user_id % 2:
+        data['photo_message_id'] = rng.randrange(10 ** 6, 10 ** 7)
+        data['manual_photo_ids'] = [rng.randrange(10 ** 6, 10 ** 7) for _ in range(3)]
+    return data
+
+def make_history(users: int, rng):
+    start = datetime(2024, 1, 1)
+    history = []
+    for user_id in range(users):
+        for _ in range(ENTRIES_PER_USER):
+            moment = start + timedelta(seconds=rng.randrange(365 * 24 * 3600), microseconds=rng.randrange(10 ** 6))
+            history.append((user_id, {
+                'phone': f"79{rng.randrange(10 ** 9):09d}",
+                'date': moment.strftime('%Y-%m-%d'),
+                'datetime': moment.isoformat(),
+                'pending': rng.random() < 0.1
+            }))
+    return history
+
+def measure(build):
+    """Прирост памяти (байты) на объекты, созданные build; результат держится до замера"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+def build_legacy_phone_index(history):
+    records = {}
+    for user_id, phone_entry in history:
+        record = records.get(phone_entry['phone'])
+        if record is None:
+            record = records[phone_entry['phone']] = LegacyPhoneRecord()
+        record.submissions.append((user_id, datetime.fromisoformat(phone_entry['datetime']).timestamp()))
+    return records
+
+def build_phone_index(history):
+    index = PhoneIndex(cooldown=86400)
+    for user_id, phone_entry in history:
+        index.add(user_id, phone_entry)
+    return index
+
+def report(title, legacy, compact, count, unit):
+    print(f"{title}: {legacy / count:.0f} -> {compact / count:.0f} байт на {unit} ({compact / legacy:.0%})")
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(1)
+    user_data = [make_user_data(user_id, rng) for user_id in range(users)]
+    history = make_history(users, rng)
+    storage = NullStorage()
+    print(f"Пользователей: {users}, записей истории: {len(history)}")
+
+    # Словари создаются внутри замера: прежний UserRecord копирует данные, новый раскладывает их по слотам
+    legacy = measure(lambda: [LegacyUserRecord(storage, user_id, dict(data)) for user_id, data in enumerate(user_data)])
+    compact = measure(lambda: [UserRecord(storage, user_id, dict(data)) for user_id, data in enumerate(user_data)])
+    report("user_data", legacy, compact, users, "пользователя")
+
+    # Записи истории JsonStorage: словарь с двумя строками даты против HistoryEntry
+    # Строки даты в прежних записях создавались для каждой записи при разборе JSON
+    legacy = measure(lambda: [
+        dict(phone_entry, date=phone_entry['date'].encode().decode(), datetime=phone_entry['datetime'].encode().decode())
+        for _, phone_entry in history
+    ])
+    compact = measure(lambda: [HistoryEntry.from_dict(phone_entry) for _, phone_entry in history])
+    report("История (JsonStorage)", legacy, compact, len(history), "запись")
+
+    legacy = measure(lambda: build_legacy_phone_index(history))
+    compact = measure(lambda: build_phone_index(history))
+    report("Индекс номеров", legacy, compact, len(history), "запись")
+
+if __name__ == '__main__':
+    main()
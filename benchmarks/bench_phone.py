@@ -0,0 +1,89 @@
+"""Сравнение проверки номеров: прежние validate_russian_phone + re.sub против check_russian_phone/scan_phones.
+
+Запуск из корня репозитория: python benchmarks/bench_phone.py
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import check_russian_phone, scan_phones
+
+def legacy_validate(phone: str) -> bool:
+    """Прежняя реализация validate_russian_phone"""
+    if not phone.strip():
+        return False
+    if re.search(r'[а-яёА-ЯЁa-zA-Z]', phone):
+        return False
+    phone_clean = re.sub(r'[^\d+]', '', phone)
+    phone_digits = re.sub(r'\D', '', phone_clean)
+    if phone_digits.startswith('8') and len(phone_digits) == 11:
+        return True
+    elif phone_digits.startswith('7') and len(phone_digits) == 11:
+        return True
+    elif phone_clean.startswith('+7') and len(phone_digits) == 11:
+        return True
+    return False
+
+def legacy_normalize(phone: str):
+    """Прежняя нормализация из process_phone_numbers"""
+    phone = phone.strip()
+    if not phone or not legacy_validate(phone):
+        return None
+    phone_digits = re.sub(r'\D', '', phone)
+    if phone_digits.startswith('8'):
+        phone_digits = '7' + phone_digits[1:]
+    return phone_digits
+
+def legacy_scan(text: str):
+    valid_phones = []
+    for phone in text.strip().split('\n'):
+        phone_digits = legacy_normalize(phone)
+        if phone_digits:
+            valid_phones.append(phone_digits)
+    return valid_phones
+
+def random_phone(rng):
+    digits = rng.choice('78') + ''.join(rng.choice('0123456789') for _ in range(10))
+    style = rng.randrange(6)
+    if style == 0:
+        return digits
+    if style == 1:
+        return f"+7 ({digits[1:4]}) {digits[4:7]}-{digits[7:9]}-{digits[9:]}"
+    if style == 2:
+        return f"8 {digits[1:4]} {digits[4:7]} {digits[7:9]} {digits[9:]}"
+    if style == 3:
+        return f"+{digits[:-1]}"  # Не хватает цифры
+    if style == 4:
+        return f"{digits[:4]}abc{digits[4:]}"  # Буквы
+    return f" {digits[:3]}.{digits[3:6]}/{digits[6:]} "  # Необычные разделители
+
+def bench(name, func, items, repeat=5):
+    def run():
+        for item in items:
+            func(item)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print(f"{name:<36} {best / len(items) * 1e9:8.0f} нс/вызов")
+
+def main():
+    rng = random.Random(1)
+    phones = [random_phone(rng) for _ in range(20000)]
+    # Новая проверка должна давать тот же результат, что и прежняя
+    for phone in phones:
+        assert check_russian_phone(phone).phone == legacy_normalize(phone), phone
+    bench("validate + re.sub (прежняя)", legacy_normalize, phones)
+    bench("check_russian_phone", check_russian_phone, phones)
+
+    # Многострочный ввод: 20 строк, подходящий номер в начале
+    texts = ["\n".join(random_phone(rng) for _ in range(20)) for _ in range(1000)]
+    for text in texts:
+        assert scan_phones(text).phones == legacy_scan(text)
+    bench("20 строк, все (прежняя)", legacy_scan, texts)
+    bench("20 строк, scan_phones", scan_phones, texts)
+    bench("20 строк, scan_phones(first_only)", lambda text: scan_phones(text, first_only=True), texts)
+
+if __name__ == "__main__":
+    main()
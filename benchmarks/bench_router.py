@@ -0,0 +1,111 @@
+"""Сравнение стоимости маршрутизации нажатий: цепочка if/elif против CallbackRouter.
+
+Запуск из корня репозитория: python benchmarks/bench_router.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import CallbackRouter, optional_int, optional_str
+
+EXACT = ["check_subscription", "add_phone", "manuals", "manual_code_input", "support", "back_to_main"]
+PREFIXES = ["take_phone_", "skip_phone_", "status_success_", "status_failed_", "reply_"]
+
+def handler(*args):
+    return args
+
+def if_chain(data):
+    """Разбор в стиле прежнего button_callback: сравнения по очереди и split для аргументов"""
+    if data == "check_subscription":
+        return handler()
+    elif data == "add_phone":
+        return handler()
+    elif data == "manuals":
+        return handler()
+    elif data == "manual_code_input":
+        return handler()
+    elif data == "support":
+        return handler()
+    elif data == "back_to_main":
+        return handler()
+    elif data.startswith("take_phone_"):
+        return handler(int(data.split("_")[-1]))
+    elif data.startswith("skip_phone_"):
+        return handler(int(data.split("_")[-1]))
+    elif data.startswith("status_success_") or data.startswith("status_failed_"):
+        return handler(int(data.split("_")[-1]), data.startswith("status_success_"))
+    elif data.startswith("check_page_"):
+        page, date_from, date_to, user_id = data[len("check_page_"):].split("_")
+        return handler(int(page), date_from or None, date_to or None, int(user_id) if user_id else None)
+    elif data.startswith("reply_"):
+        return handler(int(data.split("_")[-1]))
+    return None
+
+def build_long_if_chain(extra_routes):
+    """Цепочка if/elif с дополнительными маршрутами впереди: стоимость растет с их числом"""
+    lines = ["def chain(data):"]
+    for i in range(extra_routes):
+        lines.append(f"    if data == 'extra_{i}' or data.startswith('extra_prefix{i}_'):")
+        lines.append("        return handler()")
+    lines.append("    return if_chain(data)")
+    namespace = {'handler': handler, 'if_chain': if_chain}
+    exec("\n".join(lines), namespace)
+    return namespace['chain']
+
+def build_router():
+    router = CallbackRouter()
+    for data in EXACT:
+        router.add(data, handler)
+    for prefix in PREFIXES:
+        router.add_prefix(prefix, handler, int)
+    router.add_prefix("check_page_", handler, int, optional_str, optional_str, optional_int)
+    return router
+
+def build_filler_router(extra_routes):
+    """Роутер с дополнительными маршрутами: стоимость поиска не должна от них зависеть"""
+    router = build_router()
+    for i in range(extra_routes):
+        router.add(f"extra_{i}", handler)
+        router.add_prefix(f"extra_prefix{i}_", handler, int)
+    return router
+
+def sample_payloads(count=10000, seed=1):
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.3:
+            payloads.append(rng.choice(EXACT))
+        elif kind < 0.9:
+            payloads.append(f"{rng.choice(PREFIXES)}{rng.randrange(10 ** 9, 10 ** 10)}")
+        else:
+            payloads.append(f"check_page_{rng.randrange(50)}_2025-05-01__{rng.randrange(10 ** 9)}")
+    return payloads
+
+def bench(name, resolve, payloads, repeat=5):
+    def run():
+        for data in payloads:
+            resolve(data)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print(f"{name:<32} {best / len(payloads) * 1e9:8.0f} нс/нажатие")
+
+def main():
+    payloads = sample_payloads()
+    router = build_router()
+    # Результаты обоих способов должны совпадать по аргументам
+    for data in payloads:
+        routed, args = router.resolve(data)
+        expected = if_chain(data)
+        if data.startswith("status_"):
+            expected = expected[:1]
+        assert routed is handler and args == expected, data
+    bench("if/elif + split", if_chain, payloads)
+    bench("CallbackRouter", router.resolve, payloads)
+    bench("if/elif + split (+100 маршрутов)", build_long_if_chain(100), payloads)
+    bench("CallbackRouter (+1000 маршрутов)", build_filler_router(1000).resolve, payloads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Локальная заглушка Bot API для бенчмарков: задержка ответа и доля ответов 429 настраиваются.
+
+Понимает методы, которые вызывает бот, и отвечает правдоподобными объектами.
+Все вызовы записываются в calls: (метод, параметры). on_response(метод, параметры)
+вызывается сразу после отправки ответа - так сценарий реагирует на сообщения бота,
+как живой пользователь.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, rate_429=0.0, retry_after=1, seed=None):
+        self.latency = latency  # Задержка ответа, секунды
+        self.rate_429 = rate_429  # Доля запросов, на которые отвечаем Too Many Requests
+        self.retry_after = retry_after
+        self.calls = []
+        self.throttled = 0  # Сколько ответов 429 отдано
+        self.on_response = None
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        """Значение для BOT_API_BASE_URL"""
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def count(self, method: str) -> int:
+        return sum(1 for name, _ in self.calls if name == method)
+
+    @staticmethod
+    def _parse(headers, body):
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                params[name] = '<file>' if part.get_filename() else part.get_content()
+            return params
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        return dict(parse_qsl(body.decode()))
+
+    def _message(self, chat_id, **extra):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'}
+        }
+        message.update(extra)
+        return message
+
+    def _photo(self):
+        file_id = next(self._file_ids)
+        return [{'file_id': f'photo{file_id}', 'file_unique_id': f'u{file_id}', 'width': 1, 'height': 1}]
+
+    def _result(self, method, params):
+        chat_id = params.get('chat_id') or 1
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        if method in ('sendMessage', 'editMessageText', 'editMessageCaption'):
+            return self._message(chat_id, text=params.get('text', params.get('caption', '')))
+        if method == 'sendPhoto':
+            return self._message(chat_id, photo=self._photo())
+        if method == 'sendMediaGroup':
+            media = params['media']
+            media = json.loads(media) if isinstance(media, str) else media
+            return [self._message(chat_id, photo=self._photo()) for _ in media]
+        if method == 'sendDocument':
+            return self._message(chat_id, document={'file_id': 'document', 'file_unique_id': 'document'})
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'user'}}
+        return True
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                method = path.rsplit('/', 1)[-1]
+                params = self._parse(headers, body)
+                self.calls.append((method, params))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.rate_429 and method != 'getMe' and self._random.random() < self.rate_429:
+                    self.throttled += 1
+                    status = b'429 Too Many Requests'
+                    payload = {
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {self.retry_after}',
+                        'parameters': {'retry_after': self.retry_after}
+                    }
+                else:
+                    status = b'200 OK'
+                    payload = {'ok': True, 'result': self._result(method, params)}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b'HTTP/1.1 ' + status + b'\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(data) + data
+                )
+                await writer.drain()
+                if self.on_response is not None and status == b'200 OK':
+                    self.on_response(method, params)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,77 @@
+"""Генератор синтетической истории номеров в формате phones_history.json.
+
+Распределение похоже на живое: немногие пользователи сдают много номеров,
+большинство - по одному-два; даты разбросаны по периоду, часть номеров
+ожидает обработки, часть сдана повторно. Доля записей старого формата
+(только номер, без даты) задается отдельно.
+
+Запуск из корня репозитория:
+    python benchmarks/gen_history.py 100000 bd/phones_history.json --legacy 0.05
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import save_history
+
+FIRST_USER_ID = 100000000
+
+def generate_history(entries: int, users: int = None, legacy_share=0.05, pending_share=0.01,
+                     repeat_share=0.03, days=365, seed=1):
+    """История {user_id: [запись, ...]} из entries записей"""
+    rng = random.Random(seed)
+    users = users or max(1, entries // 4)
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    span = int((end - start).total_seconds())
+    phone_history = {}
+    phones = []
+    for _ in range(entries):
+        if rng.random() < 0.5:
+            # Половину номеров сдают немногие активные пользователи (распределение Парето)
+            index = min(users - 1, int((rng.paretovariate(1.2) - 1) * users / 50))
+        else:
+            index = rng.randrange(users)
+        user_id = FIRST_USER_ID + index
+        if phones and rng.random() < repeat_share:
+            phone = rng.choice(phones)  # Повторная сдача того же номера
+        else:
+            phone = f"79{rng.randrange(10 ** 9):09d}"
+            phones.append(phone)
+        if rng.random() < legacy_share:
+            phone_entry = phone  # Старый формат - только номер
+        else:
+            moment = start + timedelta(seconds=rng.randrange(span), microseconds=rng.randrange(10 ** 6))
+            phone_entry = {
+                'phone': phone,
+                'date': moment.strftime('%Y-%m-%d'),
+                'datetime': moment.isoformat(),
+                'pending': rng.random() < pending_share
+            }
+        phone_history.setdefault(user_id, []).append(phone_entry)
+    for phones_of_user in phone_history.values():
+        # В истории записи пользователя идут по времени сдачи, записи старого формата - первыми
+        phones_of_user.sort(key=lambda phone_entry: phone_entry['datetime'] if isinstance(phone_entry, dict) else '')
+    return phone_history
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('entries', type=int, help='число записей истории')
+    parser.add_argument('path', help='куда записать снимок истории')
+    parser.add_argument('--users', type=int, default=None, help='число пользователей (по умолчанию entries / 4)')
+    parser.add_argument('--legacy', type=float, default=0.05, help='доля записей старого формата')
+    parser.add_argument('--pending', type=float, default=0.01, help='доля номеров, ожидающих обработки')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    phone_history = generate_history(args.entries, args.users, args.legacy, args.pending, days=args.days, seed=args.seed)
+    save_history(args.path, phone_history)
+    print(f"{args.path}: {args.entries} записей, {len(phone_history)} пользователей, "
+          f"{os.path.getsize(args.path) / 2 ** 20:.1f} МБ")
+
+if __name__ == '__main__':
+    main()
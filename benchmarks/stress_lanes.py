@@ -0,0 +1,202 @@
+"""Стресс-проверка гонок при параллельной обработке обновлений против заглушки Bot API.
+
+Все обновления идут через UserLaneUpdateProcessor, как в работающем боте:
+разные пользователи обрабатываются одновременно, поэтому гонки между
+полосами проявляются так же, как под живой нагрузкой. Проверяется:
+    - один номер, сданный несколькими пользователями одновременно, попадает в очередь один раз;
+    - номер, который одновременно берут несколько админов, закрепляется за одним;
+    - статус, нажатый сразу после получения фото, засчитывается, пока админ
+      еще ждет подтверждения отправки;
+    - повторные и чужие нажатия кнопок статуса засчитывают статус один раз.
+При нарушении печатается список ошибок и код возврата равен 1.
+
+Запуск из корня репозитория:
+    python benchmarks/stress_lanes.py --users 200 --phones 60 --admins 5 --latency 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_bot import BOT_TOKEN, FIRST_ADMIN_ID, FIRST_USER_ID, callback_update, photo_update, text_update
+from fake_bot_api import FakeBotAPI
+
+ADDED_PREFIX = '✅ Добавлен'
+TAKEN_TEXT = '📞 Ваш номер взяли в обработку'
+STATUS_PREFIX = 'Статус от пользователя'
+
+def phone_of(index: int) -> str:
+    return f"7999{index:07d}"
+
+def sent_texts(api: FakeBotAPI):
+    """(chat_id, текст) всех отправленных сообщений"""
+    return [(int(params['chat_id']), params.get('text', '')) for method, params in api.calls if method == 'sendMessage']
+
+def check_queue(bot, errors: list, stage: str):
+    """Номер в очереди или в работе не больше одного раза, индекс номеров с этим согласован"""
+    phones = Counter(phone_entry.phone for phone_entry in bot.phone_queue)
+    phones.update(assignment.entry.phone for assignment in bot.assignments)
+    for phone, count in phones.items():
+        if count > 1:
+            errors.append(f"{stage}: номер {phone} в очереди и в работе {count} раз")
+        record = bot.phone_index.get(phone)
+        if record is None or record.pending != count:
+            errors.append(f"{stage}: номер {phone} ожидает обработки в индексе "
+                          f"{record.pending if record else 0} раз, в очереди и в работе {count}")
+    queued = {phone_entry.user_id for phone_entry in bot.phone_queue}
+    for assignment in bot.assignments:
+        if assignment.user_id in queued:
+            errors.append(f"{stage}: номер пользователя {assignment.user_id} одновременно в очереди и в работе")
+
+async def main(args) -> list:
+    api = FakeBotAPI(latency=args.latency, seed=1)
+    await api.start()
+    admin_ids = list(range(FIRST_ADMIN_ID, FIRST_ADMIN_ID + args.admins))
+    os.environ.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'ADMIN_IDS': ','.join(map(str, admin_ids)),
+        'BOT_API_BASE_URL': api.base_url,
+        'STORAGE_BACKEND': args.backend,
+    })
+    # bot.py читает настройки при импорте, поэтому импортируем после подготовки окружения
+    import bot as bot_module
+    from telegram import Update
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    bot = bot_module.Bot()
+    app = bot.app
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+
+    async def send(data):
+        update = Update.de_json(data, app.bot)
+        await app.update_processor.process_update(update, app.process_update(update))
+
+    async def submit(user_id: int, phone: str):
+        await send(text_update(user_id, '/start'))
+        await send(callback_update(user_id, 'add_phone'))
+        await send(text_update(user_id, f'+{phone}'))
+
+    # Пользователь жмет "Встал", как только бот отправил ему фото с кнопками
+    early_presses = []
+
+    def on_response(method, params):
+        if method == 'sendPhoto':
+            user_id = int(params['chat_id'])
+            early_presses.append(asyncio.ensure_future(send(callback_update(user_id, f'status_success_{user_id}'))))
+
+    api.on_response = on_response
+
+    errors = []
+    started = time.perf_counter()
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    phone_by_user = {user_id: phone_of(i % args.phones) for i, user_id in enumerate(user_ids)}
+
+    # Все пользователи сдают номера одновременно; несколько пользователей - один и тот же номер
+    await asyncio.gather(*(submit(user_id, phone) for user_id, phone in phone_by_user.items()))
+    added = Counter(
+        phone_by_user[chat_id] for chat_id, text in sent_texts(api)
+        if chat_id in phone_by_user and text.startswith(ADDED_PREFIX)
+    )
+    for phone, count in added.items():
+        if count > 1:
+            errors.append(f"сдача: номер {phone} принят у {count} пользователей")
+    if len(added) != min(args.phones, args.users):
+        errors.append(f"сдача: принято {len(added)} разных номеров из {min(args.phones, args.users)}")
+    check_queue(bot, errors, "сдача")
+
+    taken_users = set()
+    for round_number in range(args.rounds):
+        # Планировщик мог уже закрепить номера за админами: сначала завершаем их
+        targets = [phone_entry.user_id for phone_entry in bot.phone_queue][:args.admins]
+        if not targets and not len(bot.assignments):
+            break
+        # Каждый админ дважды жмет "Взять" на каждом из первых номеров очереди
+        await asyncio.gather(*(
+            send(callback_update(admin_id, f'take_phone_{user_id}'))
+            for admin_id in admin_ids for user_id in targets for _ in range(2)
+        ))
+        check_queue(bot, errors, f"раунд {round_number + 1}, взятие")
+        assignments = list(bot.assignments)
+        taken_users.update(assignment.user_id for assignment in assignments)
+        await asyncio.gather(*(send(photo_update(assignment.admin_id)) for assignment in assignments))
+        await asyncio.gather(*early_presses)
+        early_presses.clear()
+        for assignment in assignments:
+            if bot.assignments.by_user(assignment.user_id) is assignment:
+                errors.append(f"раунд {round_number + 1}: статус пользователя {assignment.user_id}, "
+                              f"нажатый сразу после фото, не засчитан")
+        # Пользователь жмет "Встал" еще раз, одновременно другой пользователь жмет его "Не встал"
+        await asyncio.gather(*(
+            send(callback_update(user_id, f'status_{status}_{assignment.user_id}'))
+            for assignment in assignments
+            for user_id, status in (
+                (assignment.user_id, 'success'),
+                (user_ids[(user_ids.index(assignment.user_id) + 1) % len(user_ids)], 'failed'),
+            )
+        ))
+        check_queue(bot, errors, f"раунд {round_number + 1}, статус")
+
+    texts = sent_texts(api)
+    taken = Counter(chat_id for chat_id, text in texts if text.startswith(TAKEN_TEXT))
+    statuses = Counter(
+        int(match.group(1)) for _, text in texts if text.startswith(STATUS_PREFIX)
+        for match in [re.search(r'@bench(\d+)', text)] if match
+    )
+    for user_id in taken_users:
+        if taken[user_id] != 1:
+            errors.append(f"пользователю {user_id} {taken[user_id]} раз сообщили о взятии номера")
+        if statuses[user_id] != 1:
+            errors.append(f"статус номера пользователя {user_id} засчитан {statuses[user_id]} раз")
+    if bot.phone_queue.peek() is not None or len(bot.assignments):
+        errors.append(f"после {args.rounds} раундов осталось в очереди {len(bot.phone_queue)}, "
+                      f"в работе {len(bot.assignments)}")
+    elapsed = time.perf_counter() - started
+
+    await app.stop()
+    await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+    await api.stop()
+
+    print(f"Пользователей: {args.users}, разных номеров: {args.phones}, админов: {args.admins}, "
+          f"обработано номеров: {len(taken_users)} за {elapsed:.2f} с")
+    print(f"Запросов к Bot API: {len(api.calls)}")
+    return errors
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='пользователей, сдающих номер одновременно')
+    parser.add_argument('--phones', type=int, default=60, help='разных номеров на всех пользователей')
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=100, help='наибольшее число раундов взятия номеров')
+    parser.add_argument('--latency', type=float, default=0.01, help='задержка ответа заглушки Bot API, секунды')
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    # Бот пишет в bd/ относительно текущего каталога
+    workdir = tempfile.mkdtemp(prefix='stress_lanes_')
+    os.chdir(workdir)
+    try:
+        errors = asyncio.run(main(args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if errors:
+        print(f"Нарушений: {len(errors)}")
+        for error in errors[:50]:
+            print(f"   {error}")
+        sys.exit(1)
+    print("Нарушений нет")
@@ -1,7 +1,26 @@
 import logging
 import os
-from config import load_environment
+import signal
+from datetime import datetime
+from config import UserState, load_environment
 from handlers import setup_handlers
+from phone_queue import PhoneQueue, QueueEntry
+from assignments import META_KEY as ASSIGNMENTS_META_KEY, AssignmentTable
+from scheduler import DispatchScheduler
+from messaging import NOTIFY_LIMIT, CleanupQueue, fan_out
+from ratelimit import OutboundLimiter
+from broadcast import Broadcaster
+from cache import TTLCache
+from media import MediaCache
+from report import HistoryReport
+from lanes import UserLaneUpdateProcessor
+from support import SupportDesk
+from phone_index import PhoneIndex
+from metrics import (
+    Metrics, InstrumentedRequest, QUEUE_DEPTH, QUEUE_OLDEST_WAIT, CLEANUP_PENDING, SUBSCRIPTION_CACHE_ENTRIES,
+    SUBSCRIPTION_CACHE_HITS, SUBSCRIPTION_CACHE_MISSES, SUBSCRIPTION_CACHE_COALESCED, SUPPORT_OPEN_TICKETS
+)
+from webhook import MetricsServer, WebhookServer
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application
 import asyncio
@@ -18,6 +37,19 @@ config = load_environment()
 BOT_TOKEN = config.get('BOT_TOKEN')
 ADMIN_IDS = config.get('ADMIN_IDS')
 GROUP_LINK = config.get('GROUP_LINK')
+STORAGE_BACKEND = config.get('STORAGE_BACKEND')
+PHOTO_TIMEOUT = config.get('PHOTO_TIMEOUT')
+STATUS_TIMEOUT = config.get('STATUS_TIMEOUT')
+SUBSCRIPTION_TTL = config.get('SUBSCRIPTION_TTL')
+SUBSCRIPTION_NEGATIVE_TTL = config.get('SUBSCRIPTION_NEGATIVE_TTL')
+SUBSCRIPTION_CACHE_SIZE = config.get('SUBSCRIPTION_CACHE_SIZE')
+UPDATE_CONCURRENCY = config.get('UPDATE_CONCURRENCY')
+PHONE_COOLDOWN = config.get('PHONE_COOLDOWN')
+BOT_API_BASE_URL = config.get('BOT_API_BASE_URL')
+BOT_API_POOL_SIZE = config.get('BOT_API_POOL_SIZE')
+BOT_API_POOL_TIMEOUT = config.get('BOT_API_POOL_TIMEOUT')
+METRICS_LISTEN = config.get('METRICS_LISTEN')
+METRICS_PORT = config.get('METRICS_PORT')
 
 # Дополнительные переменные для вебхука
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
@@ -29,50 +61,173 @@ class Bot:
         self.token = BOT_TOKEN
         self.admin_ids = ADMIN_IDS
         self.group_link = GROUP_LINK
+        self.storage_backend = STORAGE_BACKEND
+        self.photo_timeout = PHOTO_TIMEOUT
+        self.status_timeout = STATUS_TIMEOUT
+        self.metrics = Metrics()  # Задержки обработчиков и запросов к Bot API для /stats и /metrics
         
-        self.app = Application.builder().token(self.token).build()
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .request(InstrumentedRequest(
+                self.metrics, connection_pool_size=BOT_API_POOL_SIZE, pool_timeout=BOT_API_POOL_TIMEOUT
+            ))
+            # Все исходящие запросы: общий лимит, лимит на чат, приоритеты и повторы после RetryAfter
+            .rate_limiter(OutboundLimiter(metrics=self.metrics))
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+            .post_shutdown(self.post_shutdown)
+            # Разные пользователи обрабатываются параллельно, один пользователь - последовательно
+            .concurrent_updates(UserLaneUpdateProcessor(UPDATE_CONCURRENCY))
+        )
+        if BOT_API_BASE_URL:
+            # Локальный сервер Bot API или заглушка из benchmarks
+            builder.base_url(BOT_API_BASE_URL)
+        self.app = builder.build()
         setup_handlers(self)
         self.admin_messages = {}  # Словарь для хранения ID сообщений для каждого админа
-        self.processing_user = None # Пользователь, чей номер сейчас обрабатывается
+        self.assignments = AssignmentTable()  # Номера в работе: у каждого админа свой
+        self.scheduler = DispatchScheduler(self)  # Раздача очереди свободным админам
+        self.broadcaster = Broadcaster(self)  # Фоновая рассылка /call
+        self.cleanup = CleanupQueue(self)  # Отложенное удаление старых сообщений пачками
+        # Кэш проверки подписки на канал: отказ помним недолго, чтобы "Я подписался" срабатывало быстро
+        self.subscription_cache = TTLCache(SUBSCRIPTION_CACHE_SIZE, SUBSCRIPTION_TTL, SUBSCRIPTION_NEGATIVE_TTL)
+        self.media_cache = MediaCache(self)  # file_id картинок мануала
+        self.history_report = HistoryReport(self.user_info)  # Сводка для /check
+        self.support = SupportDesk(self)  # Обращения в поддержку и сессии ответов админов
+        self.phone_index = PhoneIndex(PHONE_COOLDOWN)  # Проверка повторной сдачи номеров
+        self.metrics.gauge(QUEUE_DEPTH, lambda: len(self.phone_queue))
+        self.metrics.gauge(QUEUE_OLDEST_WAIT, self.scheduler.oldest_wait)
+        self.metrics.gauge(CLEANUP_PENDING, lambda: len(self.cleanup))
+        self.metrics.gauge(SUPPORT_OPEN_TICKETS, lambda: len(self.support.tickets))
+        self.metrics.gauge(SUBSCRIPTION_CACHE_ENTRIES, lambda: len(self.subscription_cache))
+        self.metrics.gauge(SUBSCRIPTION_CACHE_HITS, lambda: self.subscription_cache.hits, counter=True)
+        self.metrics.gauge(SUBSCRIPTION_CACHE_MISSES, lambda: self.subscription_cache.misses, counter=True)
+        self.metrics.gauge(SUBSCRIPTION_CACHE_COALESCED, lambda: self.subscription_cache.coalesced, counter=True)
+
+    async def post_init(self, application: Application):
+        """Открытие хранилища и восстановление очереди до приема обновлений"""
+        await asyncio.to_thread(self.storage.open)
+        if not self.storage.durable_state:
+            logger.warning("Бэкенд json: очередь, рассылка и обращения не переживут перезапуск, используйте sqlite")
+        self.phone_queue = PhoneQueue(await asyncio.to_thread(self.storage.load_queue))
+        self.assignments.restore(self.storage.get_meta(ASSIGNMENTS_META_KEY, []))
+        pending = await asyncio.to_thread(self.load_history_indexes)
+        self.requeue_orphans(pending)
+        self.support.load()
+        self.scheduler.start()
+        self.broadcaster.resume()
+        self.cleanup.start()
+
+    async def post_stop(self, application: Application):
+        """Дочистка очереди удаления, пока клиент Bot API еще открыт"""
+        await self.cleanup.stop()
+
+    async def post_shutdown(self, application: Application):
+        """Дозапись накопленных изменений и закрытие хранилища при остановке"""
+        await self.scheduler.stop()
+        await self.broadcaster.stop()
+        await asyncio.to_thread(self.storage.close)
+        logger.info(f"Кэш проверки подписки: {self.subscription_cache.stats()}")
+
+    def load_history_indexes(self) -> dict:
+        """Построение сводки /check и индекса номеров за один проход по истории.
+
+        Возвращает последнюю ожидающую обработки запись каждого пользователя.
+        """
+        pending = {}
+        for user_id, phone_entry in self.storage.iter_history():
+            self.history_report.add(user_id, phone_entry)
+            self.phone_index.add(user_id, phone_entry)
+            if isinstance(phone_entry, dict) and phone_entry.get('pending', False):
+                pending[user_id] = phone_entry
+        return pending
+
+    def requeue_orphans(self, pending: dict):
+        """Возврат в очередь номеров, которые ждут обработки, но не в очереди и не в работе.
+
+        Такие номера остаются после перезапуска без сохраненной очереди (бэкенд json)
+        или после сбоя между записями; без возврата они навсегда заняты в индексе номеров.
+        """
+        for user_id, phone_entry in pending.items():
+            if self.phone_queue.get(user_id) or self.assignments.by_user(user_id):
+                continue
+            moment = phone_entry.get('datetime')
+            try:
+                timestamp = datetime.fromisoformat(moment).timestamp() if moment else None
+            except ValueError:
+                timestamp = None
+            username = self.user_data.get(user_id, {}).get('username', f'user_{user_id}')
+            queue_entry = QueueEntry(user_id, username, phone_entry['phone'], timestamp)
+            self.phone_queue.push(queue_entry)
+            self.storage.enqueue(queue_entry)
+            self.user_states[user_id] = UserState.WAITING_IN_QUEUE
+            logger.info(f"Номер пользователя {user_id} возвращен в очередь после перезапуска")
+
+    def save_assignments(self):
+        """Сохранение номеров в работе: после перезапуска аренды продолжаются"""
+        return self.storage.set_meta(ASSIGNMENTS_META_KEY, self.assignments.dump())
+
+    def user_info(self, user_id: int) -> str:
+        """Подпись пользователя для админов: @username или ID"""
+        username = self.user_data.get(user_id, {}).get('username', f'user_{user_id}')
+        return f"@{username}" if username != f"user_{user_id}" else f"ID: {user_id}"
 
-    async def notify_admin_new_phone(self, phone_entry: dict):
-        """Уведомление администраторов о новом номере"""
-        user_info = f"@{phone_entry['username']}" if phone_entry['username'] != f"user_{phone_entry['user_id']}" else f"ID: {phone_entry['user_id']}"
+    async def notify_admin_new_phone(self, phone_entry: QueueEntry):
+        """Уведомление свободных администраторов о новом номере"""
+        # Админы, у которых уже есть номер в работе, получат его из очереди, когда освободятся
+        await self.offer_phone(phone_entry, self.assignments.idle_admins(self.admin_ids))
+
+    async def offer_phone(self, phone_entry: QueueEntry, admin_ids):
+        """Отправка номера с кнопками "Взять"/"Пропустить" указанным администраторам.
+
+        Админ, которому номер уже предложен или предлагается прямо сейчас,
+        повторно его не получает: место в admin_messages занимается до отправки.
+        """
+        admin_ids = [admin_id for admin_id in admin_ids if admin_id not in self.admin_messages.get(phone_entry.user_id, ())]
+        if not admin_ids:
+            return
+        offered = self.admin_messages.setdefault(phone_entry.user_id, {})
+        for admin_id in admin_ids:
+            offered[admin_id] = None  # ID сообщения появится после отправки
+        user_info = f"@{phone_entry.username}" if phone_entry.username != f"user_{phone_entry.user_id}" else f"ID: {phone_entry.user_id}"
         
-        # Если никто не обрабатывается, показываем номер с кнопками
-        if self.processing_user is None:
-            text = f"📞 Новый номер: {phone_entry['phone']}\nОт: {user_info}\n\nВыберите действие:"
-            keyboard = [
-                [
-                    InlineKeyboardButton("Взять", callback_data=f"take_phone_{phone_entry['user_id']}"),
-                    InlineKeyboardButton("Пропустить", callback_data=f"skip_phone_{phone_entry['user_id']}")
-                ]
+        text = f"📞 Новый номер: {phone_entry.phone}\nОт: {user_info}\n\nВыберите действие:"
+        keyboard = [
+            [
+                InlineKeyboardButton("Взять", callback_data=f"take_phone_{phone_entry.user_id}"),
+                InlineKeyboardButton("Пропустить", callback_data=f"skip_phone_{phone_entry.user_id}")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Отправляем уведомление всем администраторам
-            for admin_id in self.admin_ids:
-                try:
-                    message = await self.app.bot.send_message(admin_id, text, reply_markup=reply_markup)
-                    # Сохраняем ID сообщения для каждого админа
-                    if phone_entry['user_id'] not in self.admin_messages:
-                        self.admin_messages[phone_entry['user_id']] = {}
-                    self.admin_messages[phone_entry['user_id']][admin_id] = message.message_id
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-        else:
-            # Если кто-то уже обрабатывается, добавляем в очередь БЕЗ уведомления
-            return
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        # Отправляем всем админам параллельно: время не растет с числом админов
+        results = await fan_out(
+            self.app.bot.send_message(admin_id, text, reply_markup=reply_markup, rate_limit_args=NOTIFY_LIMIT)
+            for admin_id in admin_ids
+        )
+        # Пока сообщения отправлялись, номер могли взять, пропустить или снять с очереди
+        current = self.admin_messages.get(phone_entry.user_id) is offered
+        for admin_id, result in zip(admin_ids, results):
+            pending = current and admin_id in offered
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка отправки уведомления админу {admin_id}: {result}")
+                if pending:
+                    del offered[admin_id]  # Предложим снова при следующей раздаче
+            elif pending:
+                # Сохраняем ID сообщения для каждого админа
+                offered[admin_id] = result.message_id
+            else:
+                self.cleanup.schedule(admin_id, [result.message_id])  # Предложение уже не нужно
+        if current and not offered:
+            del self.admin_messages[phone_entry.user_id]
 
-    async def delete_admin_messages(self, user_id: int, except_admin_id: int = None):
-        """Удаление сообщений о номере у всех администраторов, кроме указанного"""
+    def delete_admin_messages(self, user_id: int, except_admin_id: int = None):
+        """Удаление сообщений о номере у всех администраторов, кроме указанного (в фоне)"""
         if user_id in self.admin_messages:
             for admin_id, message_id in self.admin_messages[user_id].items():
                 if admin_id != except_admin_id:
-                    try:
-                        await self.app.bot.delete_message(chat_id=admin_id, message_id=message_id)
-                    except Exception as e:
-                        logger.error(f"Ошибка удаления сообщения у админа {admin_id}: {e}")
+                    self.cleanup.schedule(admin_id, [message_id])
             # Очищаем сообщения для данного user_id, кроме того, кто забрал
             if except_admin_id:
                 self.admin_messages[user_id] = {
@@ -81,26 +236,47 @@ class Bot:
             else:
                 del self.admin_messages[user_id]
 
+async def serve_webhook(bot_instance: Bot):
+    """Работа приложения со своим сервером вебхука до SIGINT/SIGTERM"""
+    app = bot_instance.app
+    server = WebhookServer(app, BOT_TOKEN)
+    metrics_server = MetricsServer(bot_instance.metrics)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    await app.initialize()
+    try:
+        await app.post_init(app)
+        await app.start()
+        await server.start(LISTEN_IP, PORT)
+        if METRICS_PORT:
+            await metrics_server.start(METRICS_LISTEN, METRICS_PORT)
+            logger.info(f"Метрики: http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+        await app.bot.set_webhook(f"{WEBHOOK_URL}/{BOT_TOKEN}")
+        logger.info(f"Вебхук запущен на {LISTEN_IP}:{PORT} с URL {WEBHOOK_URL}/{BOT_TOKEN}")
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await metrics_server.stop()
+        if app.running:
+            await app.stop()
+            await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+
 # Основная функция для запуска бота
 def main():
     logger.info("Запуск бота в режиме webhook...")
     
+    # Обработчики команд и сообщений настраиваются в конструкторе Bot
     bot_instance = Bot()
     
-    # Настраиваем обработчики команд и сообщений
-    setup_handlers(bot_instance)
-    
-    # Запускаем бота в режиме вебхука, используя встроенные возможности библиотеки python-telegram-bot
+    # Запускаем бота в режиме вебхука
     try:
         if WEBHOOK_URL:
-            # Обрати внимание, что app.run_webhook автоматически запускает веб-сервер и Flask
-            bot_instance.app.run_webhook(
-                listen=LISTEN_IP,
-                port=PORT,
-                url_path=BOT_TOKEN,
-                webhook_url=f"{WEBHOOK_URL}/{BOT_TOKEN}"
-            )
-            logger.info(f"Вебхук запущен на {LISTEN_IP}:{PORT} с URL {WEBHOOK_URL}/{BOT_TOKEN}")
+            # Свой сервер вместо app.run_webhook, рядом с ним - сервер метрик Prometheus
+            asyncio.run(serve_webhook(bot_instance))
         else:
             logger.error("Переменная WEBHOOK_URL не найдена. Вебхук не будет запущен.")
     except Exception as e:
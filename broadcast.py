@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from ratelimit import PRIORITY_BROADCAST
+
+logger = logging.getLogger(__name__)
+
+# Скорость отправки задает OutboundLimiter: рассылка идет с низким приоритетом
+# и не задерживает ответы пользователям
+BROADCAST_LIMIT = {'priority': PRIORITY_BROADCAST}
+# Сколько отправок выполняется одновременно
+BROADCAST_WORKERS = 20
+# После каждой пачки получателей прогресс сохраняется в хранилище
+BROADCAST_CHUNK = 200
+# Как часто обновлять сообщение с прогрессом у админа, секунды
+PROGRESS_INTERVAL = 3
+# Повторы отправки одному пользователю при сетевых ошибках и RetryAfter
+SEND_ATTEMPTS = 3
+
+META_KEY = 'broadcast'
+
+class Broadcaster:
+    """Рассылка /call с ограничением скорости и продолжением после перезапуска.
+
+    Получатели обходятся по возрастанию user_id; после каждой пачки в хранилище
+    сохраняется последний обработанный user_id, и после перезапуска рассылка
+    продолжается с него (только с бэкендом sqlite: в JsonStorage прогресс хранится
+    в памяти). Пользователи, заблокировавшие бота, исключаются из аудитории.
+    """
+
+    def __init__(self, bot, workers=BROADCAST_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, text: str, admin_id: int, progress_message_id: int = None):
+        """Запуск новой рассылки"""
+        state = {
+            'text': text,
+            'admin_id': admin_id,
+            'progress_message_id': progress_message_id,
+            'cursor': None,  # Последний обработанный user_id
+            'sent': 0,
+            'failed': 0,
+            'blocked': 0,
+            'started_at': time.time()
+        }
+        self.bot.storage.set_meta(META_KEY, state)
+        self._task = asyncio.create_task(self._run(state))
+
+    def resume(self):
+        """Продолжение рассылки, прерванной перезапуском"""
+        if not self.bot.storage.durable_state:
+            return
+        state = self.bot.storage.get_meta(META_KEY)
+        if state and not self.is_running():
+            logger.info(f"Продолжаем рассылку с пользователя {state['cursor']}")
+            self._task = asyncio.create_task(self._run(state))
+
+    async def stop(self):
+        """Остановка без сброса прогресса: рассылка продолжится при следующем запуске"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, state):
+        try:
+            cursor = state['cursor']
+            recipients = sorted(
+                user_id for user_id in self.bot.user_data.keys()
+                if cursor is None or user_id > cursor
+            )
+            total = state['sent'] + state['failed'] + state['blocked'] + len(recipients)
+            semaphore = asyncio.Semaphore(self.workers)
+            last_report = 0.0
+            for start in range(0, len(recipients), BROADCAST_CHUNK):
+                chunk = recipients[start:start + BROADCAST_CHUNK]
+                results = await asyncio.gather(*(self._send(semaphore, user_id, state['text']) for user_id in chunk))
+                for result in results:
+                    state[result] += 1
+                state['cursor'] = chunk[-1]
+                self.bot.storage.set_meta(META_KEY, state)
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report_progress(state, total)
+            self.bot.storage.set_meta(META_KEY, None)
+            await self._report_done(state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки: {e}")
+
+    async def _send(self, semaphore, user_id: int, text: str) -> str:
+        """Отправка одному пользователю; возвращает 'sent', 'failed' или 'blocked'"""
+        async with semaphore:
+            for attempt in range(SEND_ATTEMPTS):
+                try:
+                    await self.bot.app.bot.send_message(user_id, text, rate_limit_args=BROADCAST_LIMIT)
+                    return 'sent'
+                except RetryAfter:
+                    # Ограничитель уже приостановил отправку и исчерпал свои повторы - пробуем еще раз
+                    continue
+                except Forbidden:
+                    # Пользователь заблокировал бота - убираем его из аудитории рассылок
+                    del self.bot.user_data[user_id]
+                    return 'blocked'
+                except BadRequest as e:
+                    logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
+                    return 'failed'
+                except NetworkError as e:
+                    logger.warning(f"Сетевая ошибка при рассылке пользователю {user_id}: {e}")
+                    await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
+                    return 'failed'
+            return 'failed'
+
+    async def _report_progress(self, state, total: int):
+        if not state['progress_message_id']:
+            return
+        done = state['sent'] + state['failed'] + state['blocked']
+        text = (
+            f"📢 Рассылка: {done}/{total}\n"
+            f"✅ Отправлено: {state['sent']}\n"
+            f"❌ Ошибки: {state['failed']}\n"
+            f"🚫 Заблокировали бота: {state['blocked']}"
+        )
+        try:
+            await self.bot.app.bot.edit_message_text(
+                text, chat_id=state['admin_id'], message_id=state['progress_message_id'],
+                rate_limit_args=BROADCAST_LIMIT
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки: {e}")
+
+    async def _report_done(self, state):
+        elapsed = time.time() - state['started_at']
+        try:
+            await self.bot.app.bot.send_message(
+                state['admin_id'],
+                f"📢 Рассылка завершена:\n"
+                f"✅ Отправлено: {state['sent']} пользователям\n"
+                f"❌ Не удалось отправить: {state['failed']} пользователям\n"
+                f"🚫 Заблокировали бота: {state['blocked']}\n"
+                f"⏱ Время: {elapsed:.0f} с"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отправки итогов рассылки админу {state['admin_id']}: {e}")
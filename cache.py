@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Кэш с ограниченным временем жизни записей и вытеснением давно не использованных (LRU).
+
+    Отрицательные (ложные) результаты хранятся отдельно заданное, обычно более
+    короткое время. Одновременные запросы одного ключа объединяются в один вызов
+    загрузчика. Ошибки загрузчика не кэшируются.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Запросы, дождавшиеся уже идущей загрузки
+        self._data = OrderedDict()  # key -> (значение, время истечения)
+        self._inflight = {}  # key -> future загрузки, которую ждут остальные запросы
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Значение из кэша без загрузки; просроченная запись удаляется"""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        ttl = self.ttl if value else self.negative_ttl
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    async def get_or_load(self, key, loader):
+        """Значение из кэша или результат loader() - корутины, вызываемой не чаще одного раза на ключ"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            self.hits += 1
+            return value
+        future = self._inflight.get(key)
+        if future is not None:
+            # Загрузка уже идет - ждем ее результат вместо повторного запроса
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Ошибка передана ожидающим, предупреждение о ней не нужно
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                future.cancel()  # Загрузку отменили - ожидающие тоже получают отмену
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / total if total else 0.0
+        }
@@ -20,5 +20,26 @@ def load_environment():
         'ADMIN_IDS': admin_ids,
         'GROUP_LINK': "https://t.me/+0KppidSPsRFmYmUx",
         'WEBHOOK_URL': os.getenv('WEBHOOK_URL'),
-        'PORT': os.getenv('PORT')
+        'PORT': os.getenv('PORT'),
+        # Адрес и порт для GET /metrics (Prometheus); METRICS_PORT=0 - не отдавать метрики
+        'METRICS_LISTEN': os.getenv('METRICS_LISTEN', '127.0.0.1'),
+        'METRICS_PORT': int(os.getenv('METRICS_PORT', 9100)),
+        'STORAGE_BACKEND': os.getenv('STORAGE_BACKEND', 'sqlite'),
+        # Сроки (в секундах) на отправку фото админом и на подтверждение статуса пользователем
+        'PHOTO_TIMEOUT': int(os.getenv('PHOTO_TIMEOUT', 600)),
+        'STATUS_TIMEOUT': int(os.getenv('STATUS_TIMEOUT', 900)),
+        # Кэш проверки подписки: сколько секунд помнить подписанных и неподписанных пользователей
+        'SUBSCRIPTION_TTL': int(os.getenv('SUBSCRIPTION_TTL', 600)),
+        'SUBSCRIPTION_NEGATIVE_TTL': int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', 10)),
+        'SUBSCRIPTION_CACHE_SIZE': int(os.getenv('SUBSCRIPTION_CACHE_SIZE', 10000)),
+        # Сколько обновлений разных пользователей обрабатывается одновременно
+        'UPDATE_CONCURRENCY': int(os.getenv('UPDATE_CONCURRENCY', 64)),
+        # Через сколько секунд после обработки номер можно сдать повторно (0 - сразу)
+        'PHONE_COOLDOWN': int(os.getenv('PHONE_COOLDOWN', 24 * 60 * 60)),
+        # Адрес Bot API до токена, например http://127.0.0.1:8081/bot (пусто - api.telegram.org)
+        'BOT_API_BASE_URL': os.getenv('BOT_API_BASE_URL'),
+        # Пул соединений с Bot API: одновременные обработчики, рассылка и удаление сообщений
+        # не должны ждать свободного соединения дольше BOT_API_POOL_TIMEOUT секунд
+        'BOT_API_POOL_SIZE': int(os.getenv('BOT_API_POOL_SIZE', 128)),
+        'BOT_API_POOL_TIMEOUT': float(os.getenv('BOT_API_POOL_TIMEOUT', 10))
     }
\ No newline at end of file
@@ -0,0 +1,49 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('user_id', 'username', 'phone', 'date', 'datetime', 'pending')
+# До этого размера сжатая выгрузка держится в памяти, дальше - во временном файле
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+def write_export(records, export_format: str, fileobj) -> int:
+    """Потоковая запись записей истории в fileobj в виде gzip CSV или JSONL; возвращает число записей"""
+    count = 0
+    # Закрытие обертки дописывает конец gzip-потока, сам fileobj остается открытым
+    with io.TextIOWrapper(gzip.GzipFile(fileobj=fileobj, mode='wb'), encoding='utf-8', newline='') as text:
+        if export_format == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(EXPORT_COLUMNS)
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                text.write(json.dumps(dict(zip(EXPORT_COLUMNS, record)), ensure_ascii=False))
+                text.write('\n')
+                count += 1
+    return count
+
+async def build_export(storage, export_format: str, date_from=None, date_to=None, pending=None):
+    """Выгрузка истории во временный буфер; возвращает (файл, число записей).
+
+    Записи читаются генератором и сжимаются по мере чтения в отдельном потоке,
+    поэтому вся история в памяти не собирается и цикл событий не блокируется.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    # Выгрузка должна учитывать все уже принятые изменения
+    await storage.flush()
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    try:
+        records = storage.export_history(date_from, date_to, pending)
+        count = await asyncio.to_thread(write_export, records, export_format, buffer)
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer, count
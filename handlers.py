@@ -1,8 +1,9 @@
+import logging
 import os
-import re
 from datetime import datetime
 from typing import Dict, List, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import TelegramError
 from telegram.ext import (
     CommandHandler, 
     CallbackQueryHandler, 
@@ -11,18 +12,32 @@ from telegram.ext import (
     filters
 )
 from config import UserState
-from utils import load_history, save_history, validate_russian_phone
+from export import EXPORT_FORMATS, build_export
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS
+from phone_index import DUPLICATE_PENDING
+from phone_queue import PhoneQueue, QueueEntry
+from report import CHECK_PAGE_SIZE
+from router import CallbackRouter, optional_int, optional_str
+from storage import UserDataMap, UserStates, create_storage
+from utils import scan_phones
+
+logger = logging.getLogger(__name__)
+
+async def fetch_subscription(self, user_id: int) -> bool:
+    """Запрос статуса пользователя в канале у Telegram"""
+    chat_id = "-1002850457559"  # https://t.me/+0KppidSPsRFmYmUx
+    chat_member = await self.app.bot.get_chat_member(chat_id, user_id)
+    # Проверяем, является ли пользователь участником, админом или имеет заявку
+    status = chat_member.status
+    return status in ["member", "administrator", "creator", "restricted"]
 
 async def check_subscription(self, user_id: int) -> bool:
     """Проверка подписки пользователя на канал или наличия заявки"""
     try:
-        chat_id = "-1002850457559"  # https://t.me/+0KppidSPsRFmYmUx
-        chat_member = await self.app.bot.get_chat_member(chat_id, user_id)
-        # Проверяем, является ли пользователь участником, админом или имеет заявку
-        status = chat_member.status
-        return status in ["member", "administrator", "creator", "restricted"]
+        # Результат кэшируется, одновременные проверки одного пользователя объединяются
+        return await self.subscription_cache.get_or_load(user_id, lambda: fetch_subscription(self, user_id))
     except Exception as e:
-        print(f"Ошибка проверки подписки: {e}")
+        logger.error(f"Ошибка проверки подписки: {e}")
         return False
 
 async def show_subscription_check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -93,20 +108,14 @@ async def show_code_input_manual(self, update: Update, context: ContextTypes.DEF
     """Показ мануала о вводе кода"""
     await update.callback_query.answer()
     
-    # Создаем медиа группу
-    media_group = []
-    for i in range(1, 6):
-        photo_path = f"assets/{i}.jpg"
-        with open(photo_path, 'rb') as photo_file:
-            media_group.append(InputMediaPhoto(media=photo_file.read()))
-    
     # Удаляем предыдущее сообщение
     await update.callback_query.delete_message()
     
-    # Отправляем медиа группу и сохраняем ID сообщений
-    messages = await context.bot.send_media_group(
-        chat_id=update.effective_chat.id,
-        media=media_group
+    # Отправляем медиа группу (файлы загружаются в Telegram один раз, дальше по file_id) и сохраняем ID сообщений
+    messages = await self.media_cache.send_photo_group(
+        context.bot,
+        update.effective_chat.id,
+        [f"assets/{i}.jpg" for i in range(1, 6)]
     )
     
     # Сохраняем ID сообщений в user_data
@@ -154,72 +163,81 @@ async def process_phone_numbers(self, update: Update, context: ContextTypes.DEFA
     username = update.effective_user.username or f"user_{user_id}"
     
     # Проверяем, не ожидает ли пользователь статуса по предыдущему номеру
-    if self.user_states.get(user_id) == UserState.WAITING_FOR_PHOTO:
+    # (номер может быть уже взят админом, а фото еще не отправлено)
+    if self.user_states.get(user_id) == UserState.WAITING_FOR_PHOTO or self.assignments.by_user(user_id):
         text = "⏳ Дождитесь обработки вашего предыдущего номера (нажмите 'Встал' или 'Не встал')."
         keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_main")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(text, reply_markup=reply_markup)
         return
     
-    phones = phones_text.strip().split('\n')
-    valid_phones = []
-    invalid_count = 0
-    
-    for phone in phones:
-        phone = phone.strip()
-        if phone:  # Если строка не пустая
-            if validate_russian_phone(phone):
-                # Нормализация номера
-                phone_digits = re.sub(r'\D', '', phone)
-                if phone_digits.startswith('8'):
-                    phone_digits = '7' + phone_digits[1:]
-                valid_phones.append(phone_digits)
-            else:
-                invalid_count += 1
+    # Сдается только первый подходящий номер, остальные корректные только считаются
+    scan = scan_phones(phones_text, first_only=True)
+    invalid_count = scan.invalid
     
-    if valid_phones:
-        # Берем только первый номер для обработки
-        first_phone = valid_phones[0]
+    if scan.phones:
+        # Номер уже нормализован: 11 цифр, начиная с 7
+        first_phone = scan.phones[0]
         
-        # Добавляем только первый номер в очередь
-        phone_entry = {
-            'user_id': user_id,
-            'username': username,
-            'phone': first_phone,
-            'timestamp': datetime.now(),
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'admin_id': None  # Поле для хранения ID админа, который взял номер
-        }
-        self.phone_queue.append(phone_entry)
+        # Один и тот же номер не принимаем, пока он в работе или не прошло окно повторной сдачи
+        duplicate = self.phone_index.check(first_phone)
+        if duplicate:
+            if duplicate == DUPLICATE_PENDING:
+                text = f"❌ Номер +{first_phone} уже находится в очереди или в обработке."
+            else:
+                available_at = datetime.fromtimestamp(self.phone_index.available_at(first_phone))
+                text = f"❌ Номер +{first_phone} уже сдавался недавно.\nПовторно его можно сдать после {available_at.strftime('%d.%m.%Y %H:%M')}."
+            keyboard = [
+                [InlineKeyboardButton("Добавить еще раз", callback_data="add_phone")],
+                [InlineKeyboardButton("Назад", callback_data="back_to_main")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            return
         
-        # Уведомляем админа
-        await self.notify_admin_new_phone(phone_entry)
+        # Проверка и занятие номера идут без await между ними: иначе два пользователя,
+        # параллельно сдающие один номер, оба пройдут проверку
+        # Добавляем только первый номер в очередь
+        phone_entry = QueueEntry(user_id, username, first_phone)
+        self.phone_queue.push(phone_entry)
+        self.storage.enqueue(phone_entry)
         
         # Добавляем номер в историю с датой и флагом pending
-        if self.phone_history is None:
-            self.phone_history = {}
-        if user_id not in self.phone_history:
-            self.phone_history[user_id] = []
+        now = datetime.now()
         phone_with_date = {
             'phone': first_phone,
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'datetime': datetime.now().isoformat(),
+            'date': now.strftime('%Y-%m-%d'),
+            'datetime': now.isoformat(),
             'pending': True  # Номер ожидает обработки
         }
-        self.phone_history[user_id].append(phone_with_date)
-        save_history(self.db_file, self.phone_history)
+        durable = self.storage.add_history(user_id, phone_with_date)
+        self.history_report.add(user_id, phone_with_date)
+        self.phone_index.add(user_id, phone_with_date)
         
         self.user_states[user_id] = UserState.WAITING_IN_QUEUE
         
-        remaining_count = len(valid_phones) - 1
+        # Уведомляем админов в фоне: ответ пользователю не ждет лимитов их чатов
+        self.app.create_task(self.notify_admin_new_phone(phone_entry), update=update)
+        
+        remaining_count = scan.skipped
         if remaining_count > 0:
             text = f"✅ Добавлен 1 номер в очередь.\n⚠️ Остальные {remaining_count} номеров не добавлены (можно сдавать только по одному).\nОжидайте, пока ваш номер возьмут в обработку."
         else:
             text = f"✅ Добавлен 1 номер в очередь.\nОжидайте, пока ваш номер возьмут в обработку."
         
+        position = self.phone_queue.position(user_id)
+        if position:
+            text += f"\n📍 Позиция в очереди: {position}"
+        
         keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_main")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        # Подтверждаем добавление только после сброса записи на диск
+        try:
+            await durable
+        except Exception as e:
+            logger.error(f"Ошибка сохранения истории: {e}")
+        
         message = await update.message.reply_text(text, reply_markup=reply_markup)
         self.user_data[user_id]['queue_message_id'] = message.message_id
         
@@ -243,26 +261,15 @@ async def process_support_message(self, update: Update, context: ContextTypes.DE
     user_id = update.effective_user.id
     username = update.effective_user.username or f"user_{user_id}"
     
-    # Отправляем сообщение админу
+    # Отправляем сообщение наименее загруженному админу в сети
     user_info = f"@{username}" if username != f"user_{user_id}" else f"ID: {user_id}"
-    admin_text = f"💬 Сообщение в поддержку от {user_info}:\n\n{message_text}"
-    
-    keyboard = [[InlineKeyboardButton("Ответить", callback_data=f"reply_{user_id}")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     
     try:
-        await self.app.bot.send_message(self.admin_ids[0], admin_text, reply_markup=reply_markup)
+        await self.support.submit(user_id, user_info, message_text)
         
-        # Удаляем сообщение "Напишите ваше сообщение поддержке"
-        if user_id in self.user_data and 'support_message_id' in self.user_data[user_id]:
-            try:
-                await context.bot.delete_message(
-                    chat_id=update.effective_chat.id,
-                    message_id=self.user_data[user_id]['support_message_id']
-                )
-            except:
-                pass
-            self.user_data[user_id].pop('support_message_id', None)
+        # Сообщение "Напишите ваше сообщение поддержке" удаляется в фоне, после ответа
+        if user_id in self.user_data:
+            self.cleanup.schedule(update.effective_chat.id, [self.user_data[user_id].pop('support_message_id', None)])
         
         self.user_states[user_id] = UserState.IDLE
         
@@ -285,13 +292,15 @@ async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE)
     if user_id not in self.admin_ids:
         await update.message.reply_text("❌ Только администраторы могут отправлять фотографии.")
         return
+    self.support.touch(user_id)
     
-    # Проверяем, есть ли пользователь в обработке
-    if self.processing_user is None:
-        return  # Не отвечаем, если нет пользователей в обработке
+    # Проверяем, есть ли у этого админа номер в обработке
+    assignment = self.assignments.by_admin(user_id)
+    if assignment is None:
+        return  # Не отвечаем, если админ не брал номер
     
-    # Отправляем фото пользователю
-    target_user_id = self.processing_user
+    # Отправляем фото пользователю, чей номер взял этот админ
+    target_user_id = assignment.user_id
     try:
         # Отправляем фото
         message = await self.app.bot.send_photo(
@@ -306,13 +315,35 @@ async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE)
             ])
         )
         
+        # Пока фото отправлялось, срок аренды мог истечь и номер вернулся в очередь:
+        # кнопки статуса тогда сняли бы чужую аренду этого пользователя
+        if self.assignments.by_user(target_user_id) is not assignment:
+            try:
+                await self.app.bot.edit_message_caption(
+                    chat_id=target_user_id,
+                    message_id=message.message_id,
+                    caption="⏳ Время на обработку истекло, номер возвращен в очередь.",
+                    reply_markup=None
+                )
+            except Exception as e:
+                logger.error(f"Ошибка снятия кнопок статуса у пользователя {target_user_id}: {e}")
+            await update.message.reply_text("⏰ Время на обработку номера истекло, фото не засчитано.")
+            return
+        
         # Сохраняем ID сообщения с фото
         self.user_data[target_user_id]['photo_message_id'] = message.message_id
         
+        # Дальше срок аренды идет на подтверждение статуса пользователем
+        assignment.photo_sent = True
+        self.assignments.renew(assignment, self.status_timeout)
+        self.save_assignments()
+        self.scheduler.kick()
+        # Состояние меняем до следующего await: кнопки статуса у пользователя уже есть,
+        # и его нажатие обрабатывается параллельно в его полосе
+        self.user_states[target_user_id] = UserState.WAITING_FOR_PHOTO
+        
         # Уведомляем админа
         await update.message.reply_text("✅ Фото отправлено пользователю. Ожидаем подтверждения статуса.")
-        
-        self.user_states[target_user_id] = UserState.WAITING_FOR_PHOTO
     except Exception as e:
         await update.message.reply_text("❌ Ошибка отправки фото пользователю.")
 
@@ -322,29 +353,24 @@ async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Проверяем, не админ ли это
     if user_id in self.admin_ids:
-        # Если админ отвечает на сообщение пользователя
-        if self.user_states.get(user_id) == UserState.WAITING_FOR_ADMIN_REPLY and self.pending_admin_reply:
-            target_user_id = self.pending_admin_reply
-            
+        self.support.touch(user_id)
+        # Если админ отвечает на сообщение пользователя (у каждого админа своя сессия ответа)
+        if self.user_states.get(user_id) == UserState.WAITING_FOR_ADMIN_REPLY and self.support.session(user_id):
             try:
                 # Отправляем ответ пользователю
-                await self.app.bot.send_message(
-                    target_user_id,
-                    f"💬 Ответ от поддержки:\n\n{update.message.text}"
-                )
+                await self.support.reply(user_id, update.message.text)
                 
                 # Подтверждение админу
                 await update.message.reply_text("✅ Ответ отправлен пользователю.")
                 
                 # Сбрасываем состояние
-                self.pending_admin_reply = None
                 self.user_states[user_id] = UserState.IDLE
                 
             except Exception as e:
                 await update.message.reply_text("❌ Ошибка отправки ответа.")
         else:
-            # Игнорируем сообщения от админов, если нет пользователей в обработке
-            if self.processing_user is None:
+            # Игнорируем сообщения от админов, у которых нет номера в обработке
+            if not self.assignments.is_busy(user_id):
                 return
             await update.message.reply_text("👨‍💼 Администраторы не могут отправлять номера. Отправьте фото для обработки номеров.")
         return
@@ -356,348 +382,404 @@ async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await process_support_message(self, update, context, update.message.text)
 
 async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик нажатий на кнопки"""
+    """Обработчик нажатий на кнопки: маршрут выбирается по таблице callback_router"""
     query = update.callback_query
     user_id = query.from_user.id
-    data = query.data
     
     await query.answer()
     
-    if data == "check_subscription":
-        is_subscribed = await check_subscription(self, user_id)
-        if is_subscribed:
-            # Удаляем сообщение с проверкой подписки
-            if user_id in self.user_data and 'subscription_message_id' in self.user_data[user_id]:
-                try:
-                    await context.bot.delete_message(
-                        chat_id=query.message.chat_id,
-                        message_id=self.user_data[user_id]['subscription_message_id']
-                    )
-                except:
-                    pass
-                self.user_data[user_id].pop('subscription_message_id', None)
-            await show_main_menu(self, update, context)
-        else:
-            await show_subscription_check(self, update, context)
-    
-    elif data == "add_phone":
-        await show_phone_input(self, update, context)
-    
-    elif data == "manuals":
-        await show_manuals(self, update, context)
-    
-    elif data == "manual_code_input":
-        await show_code_input_manual(self, update, context)
-    
-    elif data == "support":
-        await show_support_input(self, update, context)
-    
-    elif data == "back_to_main":
-        # Удаляем сообщения мануалов, если они есть
-        if user_id in self.user_data and 'manual_photo_ids' in self.user_data[user_id]:
-            for message_id in self.user_data[user_id]['manual_photo_ids']:
-                try:
-                    await context.bot.delete_message(
-                        chat_id=query.message.chat_id,
-                        message_id=message_id
-                    )
-                except:
-                    pass
-            self.user_data[user_id].pop('manual_photo_ids', None)
-        
-        # Удаляем сообщение ввода номера или поддержки
+    if user_id in self.admin_ids:
+        self.support.touch(user_id)
+    
+    await self.callback_router.dispatch(self, update, context)
+
+async def on_check_subscription(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Я подписался": повторная проверка подписки"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    is_subscribed = await check_subscription(self, user_id)
+    if is_subscribed:
+        # Сообщение с проверкой подписки удаляется в фоне, после показа меню
         if user_id in self.user_data:
-            for key in ['support_message_id', 'subscription_message_id', 'queue_message_id']:
-                if key in self.user_data[user_id]:
-                    try:
-                        await context.bot.delete_message(
-                            chat_id=query.message.chat_id,
-                            message_id=self.user_data[user_id][key]
-                        )
-                    except:
-                        pass
-                    self.user_data[user_id].pop(key, None)
-        
-        self.user_states[user_id] = UserState.IDLE
+            self.cleanup.schedule(query.message.chat_id, [self.user_data[user_id].pop('subscription_message_id', None)])
         await show_main_menu(self, update, context)
+    else:
+        await show_subscription_check(self, update, context)
+
+async def on_back_to_main(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Назад" в главное меню"""
+    query = update.callback_query
+    user_id = query.from_user.id
     
-    elif data.startswith("take_phone_"):
-        if user_id not in self.admin_ids:
-            try:
-                await query.edit_message_text("❌ Только администраторы могут брать номера.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут брать номера.")
-            return
-        
-        target_user_id = int(data.split("_")[-1])
-        
-        # Проверяем, что номер еще в очереди
-        phone_entry = next((entry for entry in self.phone_queue if entry['user_id'] == target_user_id), None)
-        if not phone_entry:
-            try:
-                await query.edit_message_text("❌ Этот номер уже обработан или удален из очереди.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Этот номер уже обработан или удален из очереди.")
-            return
-        
-        # Устанавливаем пользователя в обработку и сохраняем ID админа
-        self.processing_user = target_user_id
-        self.processing_admin = user_id  # Сохраняем ID админа, который взял номер
-        self.phone_queue = [entry for entry in self.phone_queue if entry['user_id'] != target_user_id]
-        
-        # Удаляем сообщения у других админов
-        await self.delete_admin_messages(target_user_id, except_admin_id=user_id)
-        
-        # Уведомляем пользователя и удаляем предыдущее сообщение
+    # Сообщения мануалов и сообщение ввода номера или поддержки удаляются в фоне одним запросом
+    if user_id in self.user_data:
+        message_ids = list(self.user_data[user_id].get('manual_photo_ids', []))
+        for key in ['support_message_id', 'subscription_message_id', 'queue_message_id']:
+            if key in self.user_data[user_id]:
+                message_ids.append(self.user_data[user_id][key])
+        self.cleanup.schedule(query.message.chat_id, message_ids)
+        for key in ['manual_photo_ids', 'support_message_id', 'subscription_message_id', 'queue_message_id']:
+            self.user_data[user_id].pop(key, None)
+    
+    self.user_states[user_id] = UserState.IDLE
+    await show_main_menu(self, update, context)
+
+async def on_take_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
+    """Кнопка "Взять" у админа"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    if user_id not in self.admin_ids:
         try:
-            if target_user_id in self.user_data and 'queue_message_id' in self.user_data[target_user_id]:
-                try:
-                    await context.bot.delete_message(
-                        chat_id=target_user_id,
-                        message_id=self.user_data[target_user_id]['queue_message_id']
-                    )
-                except:
-                    pass
-                self.user_data[target_user_id].pop('queue_message_id', None)
-            
-            await self.app.bot.send_message(
-                target_user_id,
-                "📞 Ваш номер взяли в обработку, ожидайте код."
-            )
+            await query.edit_message_text("❌ Только администраторы могут брать номера.")
         except:
-            pass
-        
-        # Обновляем сообщение текущего админа
+            await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут брать номера.")
+        return
+    
+    # Проверяем, что номер еще в очереди
+    phone_entry = self.phone_queue.get(target_user_id)
+    if not phone_entry:
         try:
-            await query.edit_message_text(
-                f"📞 Вы взяли номер: {phone_entry['phone']}\nОт: @{phone_entry['username']}\n\nОтправьте фото для обработки."
-            )
+            await query.edit_message_text("❌ Этот номер уже обработан или удален из очереди.")
         except:
-            await context.bot.send_message(
-                query.message.chat_id,
-                f"📞 Вы взяли номер: {phone_entry['phone']}\nОт: @{phone_entry['username']}\n\nОтправьте фото для обработки."
-            )
+            await context.bot.send_message(query.message.chat_id, "❌ Этот номер уже обработан или удален из очереди.")
+        return
     
-    elif data.startswith("skip_phone_"):
-        if user_id not in self.admin_ids:
-            try:
-                await query.edit_message_text("❌ Только администраторы могут пропускать номера.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут пропускать номера.")
-            return
-        
-        target_user_id = int(data.split("_")[-1])
-        
-        # Проверяем, что номер еще в очереди
-        phone_entry = next((entry for entry in self.phone_queue if entry['user_id'] == target_user_id), None)
-        if not phone_entry:
-            try:
-                await query.edit_message_text("❌ Этот номер уже обработан или удален из очереди.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Этот номер уже обработан или удален из очереди.")
-            return
-        
-        # Удаляем сообщение только у текущего админа
-        if target_user_id in self.admin_messages and user_id in self.admin_messages[target_user_id]:
-            try:
-                await self.app.bot.delete_message(
-                    chat_id=user_id,
-                    message_id=self.admin_messages[target_user_id][user_id]
-                )
-                del self.admin_messages[target_user_id][user_id]
-                if not self.admin_messages[target_user_id]:
-                    del self.admin_messages[target_user_id]
-            except:
-                pass
+    # Один админ обрабатывает не больше одного номера одновременно
+    if self.assignments.is_busy(user_id):
+        await context.bot.send_message(query.message.chat_id, "⏳ Сначала завершите обработку текущего номера.")
+        return
+    
+    # И у одного пользователя в обработке не больше одного номера
+    if self.assignments.by_user(target_user_id):
+        await context.bot.send_message(query.message.chat_id, "❌ Номер этого пользователя уже в обработке.")
+        return
+    
+    # Закрепляем номер за админом, который его взял
+    self.assignments.assign(user_id, phone_entry, self.photo_timeout)
+    self.save_assignments()
+    self.phone_queue.remove(target_user_id)
+    self.scheduler.record_taken(phone_entry)
+    self.scheduler.kick()  # Планировщик пересчитает ближайший срок аренды
+    self.storage.dequeue(target_user_id)
+    
+    # Сообщения у других админов удаляются в фоне
+    self.delete_admin_messages(target_user_id, except_admin_id=user_id)
+    
+    # Уведомляем пользователя, предыдущее сообщение удаляется в фоне
+    try:
+        if target_user_id in self.user_data:
+            self.cleanup.schedule(target_user_id, [self.user_data[target_user_id].pop('queue_message_id', None)])
         
-        # Обновляем сообщение или отправляем новое
+        await self.app.bot.send_message(
+            target_user_id,
+            "📞 Ваш номер взяли в обработку, ожидайте код."
+        )
+    except TelegramError as e:
+        logger.error(f"Ошибка уведомления пользователя {target_user_id} о взятии номера: {e}")
+    
+    # Обновляем сообщение текущего админа
+    try:
+        await query.edit_message_text(
+            f"📞 Вы взяли номер: {phone_entry.phone}\nОт: @{phone_entry.username}\n\nОтправьте фото для обработки."
+        )
+    except:
+        await context.bot.send_message(
+            query.message.chat_id,
+            f"📞 Вы взяли номер: {phone_entry.phone}\nОт: @{phone_entry.username}\n\nОтправьте фото для обработки."
+        )
+
+async def on_skip_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
+    """Кнопка "Пропустить" у админа"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    if user_id not in self.admin_ids:
         try:
-            await query.edit_message_text("✅ Номер пропущен.")
+            await query.edit_message_text("❌ Только администраторы могут пропускать номера.")
         except:
-            await context.bot.send_message(query.message.chat_id, "✅ Номер пропущен.")
+            await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут пропускать номера.")
+        return
     
-    elif data.startswith("status_success_") or data.startswith("status_failed_"):
-        target_user_id = int(data.split("_")[-1])
-        status_text = "✅ Номер встал!" if data.startswith("status_success_") else "❌ Номер не встал."
-        
-        # Проверяем, что пользователь ожидает статуса
-        if self.user_states.get(target_user_id) != UserState.WAITING_FOR_PHOTO:
-            try:
-                await query.edit_message_text("❌ Статус уже обработан или недоступен.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Статус уже обработан или недоступен.")
-            return
-        
-        # Обновляем историю: убираем флаг pending
-        if target_user_id in self.phone_history:
-            for phone_entry in self.phone_history[target_user_id]:
-                if phone_entry.get('pending', False):
-                    phone_entry['pending'] = False
-            save_history(self.db_file, self.phone_history)
-        
-        # Уведомляем только админа, который взял номер
-        username = self.user_data.get(target_user_id, {}).get('username', f'user_{target_user_id}')
-        if self.processing_admin:
-            try:
-                await self.app.bot.send_message(
-                    self.processing_admin,
-                    f"Статус от пользователя: {status_text}\nОт: @{username}"
-                )
-            except:
-                pass
-        
-        # Сбрасываем пользователя и админа в обработке
-        self.processing_user = None
-        self.processing_admin = None
-        
-        # Удаляем кнопки у пользователя
+    # Проверяем, что номер еще в очереди
+    phone_entry = self.phone_queue.get(target_user_id)
+    if not phone_entry:
         try:
-            await query.edit_message_caption(
-                caption=f"Результат обработки вашего номера:\n{status_text}",
-                reply_markup=None
-            )
+            await query.edit_message_text("❌ Этот номер уже обработан или удален из очереди.")
+        except:
+            await context.bot.send_message(query.message.chat_id, "❌ Этот номер уже обработан или удален из очереди.")
+        return
+    
+    # Больше не предлагаем этот номер текущему админу
+    self.scheduler.mark_skipped(target_user_id, user_id)
+    
+    # Удаляем сообщение только у текущего админа, в фоне
+    if target_user_id in self.admin_messages and user_id in self.admin_messages[target_user_id]:
+        self.cleanup.schedule(user_id, [self.admin_messages[target_user_id].pop(user_id)])
+        if not self.admin_messages[target_user_id]:
+            del self.admin_messages[target_user_id]
+    
+    # Обновляем сообщение или отправляем новое
+    try:
+        await query.edit_message_text("✅ Номер пропущен.")
+    except:
+        await context.bot.send_message(query.message.chat_id, "✅ Номер пропущен.")
+
+async def on_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int, success: bool):
+    """Кнопки статуса номера у пользователя"""
+    query = update.callback_query
+    
+    status_text = "✅ Номер встал!" if success else "❌ Номер не встал."
+    
+    # Проверяем, что пользователь ожидает статуса
+    if self.user_states.get(target_user_id) != UserState.WAITING_FOR_PHOTO:
+        try:
+            await query.edit_message_text("❌ Статус уже обработан или недоступен.")
         except:
-            await context.bot.send_message(
-                query.message.chat_id,
-                f"Результат обработки вашего номера:\n{status_text}"
+            await context.bot.send_message(query.message.chat_id, "❌ Статус уже обработан или недоступен.")
+        return
+    
+    # Сразу меняем состояние, чтобы повторное нажатие не засчитало статус дважды
+    self.user_states[target_user_id] = UserState.IDLE
+    
+    # Обновляем историю: убираем флаг pending
+    self.storage.resolve_history(target_user_id)
+    self.history_report.resolve(target_user_id)
+    self.phone_index.resolve(target_user_id)
+    
+    # Снимаем номер с обработки у админа, который его взял
+    assignment = self.assignments.release_user(target_user_id)
+    if assignment:
+        self.save_assignments()
+    self.admin_messages.pop(target_user_id, None)
+    
+    # Уведомляем только админа, который взял номер
+    username = self.user_data.get(target_user_id, {}).get('username', f'user_{target_user_id}')
+    if assignment:
+        try:
+            await self.app.bot.send_message(
+                assignment.admin_id,
+                f"Статус от пользователя: {status_text}\nОт: @{username}"
             )
-        
-        # Возвращаем пользователя в главное меню
-        self.user_states[target_user_id] = UserState.IDLE
+        except TelegramError as e:
+            logger.error(f"Ошибка уведомления админа {assignment.admin_id} о статусе номера: {e}")
     
-    elif data.startswith("reply_"):
-        if user_id not in self.admin_ids:
-            try:
-                await query.edit_message_text("❌ Только администраторы могут отвечать на сообщения.")
-            except:
-                await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут отвечать на сообщения.")
-            return
-        
-        target_user_id = int(data.split("_")[-1])
-        self.pending_admin_reply = target_user_id
-        self.user_states[user_id] = UserState.WAITING_FOR_ADMIN_REPLY
-        
+    # Удаляем кнопки у пользователя
+    try:
+        await query.edit_message_caption(
+            caption=f"Результат обработки вашего номера:\n{status_text}",
+            reply_markup=None
+        )
+    except:
+        await context.bot.send_message(
+            query.message.chat_id,
+            f"Результат обработки вашего номера:\n{status_text}"
+        )
+    
+    # Освободившийся админ сразу получает следующий номер из очереди
+    self.scheduler.kick()
+
+async def on_check_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page: int, date_from=None, date_to=None, filter_user_id=None):
+    """Листание страниц отчета /check"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    if user_id not in self.admin_ids:
+        return
+    text, reply_markup = render_check_page(self, page, date_from, date_to, filter_user_id)
+    try:
+        await query.edit_message_text(text or "📋 Нет сданных номеров по заданному фильтру.", reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Ошибка переключения страницы отчета: {e}")
+
+async def on_reply(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
+    """Кнопка "Ответить" на обращение в поддержку"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    if user_id not in self.admin_ids:
         try:
-            await query.edit_message_text("✍️ Напишите ваш ответ пользователю:")
+            await query.edit_message_text("❌ Только администраторы могут отвечать на сообщения.")
         except:
-            await context.bot.send_message(query.message.chat_id, "✍️ Напишите ваш ответ пользователю:")
+            await context.bot.send_message(query.message.chat_id, "❌ Только администраторы могут отвечать на сообщения.")
+        return
+    
+    self.support.start_reply(user_id, target_user_id)
+    self.user_states[user_id] = UserState.WAITING_FOR_ADMIN_REPLY
+    
+    try:
+        await query.edit_message_text("✍️ Напишите ваш ответ пользователю:")
+    except:
+        await context.bot.send_message(query.message.chat_id, "✍️ Напишите ваш ответ пользователю:")
+
+def build_callback_router(metrics=None):
+    """Таблица маршрутов инлайн-кнопок"""
+    router = CallbackRouter(metrics)
+    router.add("check_subscription", on_check_subscription)
+    router.add("add_phone", show_phone_input)
+    router.add("manuals", show_manuals)
+    router.add("manual_code_input", show_code_input_manual)
+    router.add("support", show_support_input)
+    router.add("back_to_main", on_back_to_main)
+    router.add_prefix("take_phone_", on_take_phone, int)
+    router.add_prefix("skip_phone_", on_skip_phone, int)
+    router.add_prefix("status_success_", lambda bot, update, context, target_user_id: on_status(bot, update, context, target_user_id, True), int)
+    router.add_prefix("status_failed_", lambda bot, update, context, target_user_id: on_status(bot, update, context, target_user_id, False), int)
+    router.add_prefix("check_page_", on_check_page, int, optional_str, optional_str, optional_int)
+    router.add_prefix("reply_", on_reply, int)
+    return router
+
+def parse_check_date(value: str):
+    """Дата из аргумента /check: ДД.ММ.ГГГГ или ГГГГ-ММ-ДД; None, если это не дата"""
+    for date_format in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return None
+
+def find_history_user(self, value: str):
+    """user_id из аргумента /check: числовой ID или @username"""
+    if value.isdigit():
+        return int(value)
+    # Поиск по индексу username в хранилище, без обхода всех пользователей истории
+    history_user_ids = self.history_report.user_ids()
+    for user_id in self.storage.find_users_by_username(value.lstrip('@')):
+        if user_id in history_user_ids:
+            return user_id
+    return None
+
+def render_check_page(self, page: int, date_from=None, date_to=None, filter_user_id=None):
+    """Текст и кнопки страницы отчета /check"""
+    total = self.history_report.count(date_from, date_to, filter_user_id)
+    if total == 0:
+        return None, None
+    pages = (total + CHECK_PAGE_SIZE - 1) // CHECK_PAGE_SIZE
+    page = max(0, min(page, pages - 1))  # История могла измениться с момента показа кнопок
+    
+    header = "📊 История сданных номеров"
+    if date_from or date_to:
+        period_from = datetime.strptime(date_from, '%Y-%m-%d').strftime('%d.%m.%Y') if date_from else "..."
+        period_to = datetime.strptime(date_to, '%Y-%m-%d').strftime('%d.%m.%Y') if date_to else "..."
+        header += f" за {period_from} - {period_to}" if date_from != date_to else f" за {period_from}"
+    if filter_user_id:
+        header += f"\n👤 {self.user_info(filter_user_id)}"
+    header += f"\nВсего: {total}, страница {page + 1}/{pages}\n\n"
+    text = header + self.history_report.page(page, CHECK_PAGE_SIZE, date_from, date_to, filter_user_id)
+    
+    # Фильтр передается в callback_data, чтобы листать ту же выборку
+    suffix = f"{date_from or ''}_{date_to or ''}_{filter_user_id or ''}"
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️", callback_data=f"check_page_{page - 1}_{suffix}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("➡️", callback_data=f"check_page_{page + 1}_{suffix}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return text, reply_markup
 
 async def admin_check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда /check для администратора - показ всех сданных номеров"""
+    """Команда /check для администратора - показ сданных номеров по страницам.
+
+    Аргументы (необязательные): одна дата или две даты периода (ДД.ММ.ГГГГ)
+    и пользователь (@username или ID), например: /check 01.05.2025 31.05.2025 @user
+    """
     user_id = update.effective_user.id
     
     # Проверяем, что это админ
     if user_id not in self.admin_ids:
         return  # Не отправляем никакого ответа для неадминов
     
-    if not self.phone_history:
-        await update.message.reply_text("📋 История номеров пуста.")
+    dates = []
+    filter_user_id = None
+    for arg in context.args or []:
+        date_str = parse_check_date(arg)
+        if date_str and len(dates) < 2:
+            dates.append(date_str)
+            continue
+        if filter_user_id is None:
+            filter_user_id = find_history_user(self, arg)
+            if filter_user_id is not None:
+                continue
+        await update.message.reply_text(
+            "❌ Неверные параметры.\n"
+            "Использование: /check [дата] [дата по] [@username или ID]\n"
+            "Например: /check 01.05.2025 31.05.2025 @user"
+        )
+        return
+    date_from = min(dates) if dates else None
+    date_to = max(dates) if dates else None
+    
+    # Сводка обновляется при добавлении и обработке номеров, перебирать историю не нужно
+    text, reply_markup = render_check_page(self, 0, date_from, date_to, filter_user_id)
+    if text is None:
+        if dates or filter_user_id:
+            await update.message.reply_text("📋 Нет сданных номеров по заданному фильтру.")
+        else:
+            await update.message.reply_text("📋 История номеров пуста.")
         return
     
-    # Собираем все номера с датами, исключая pending
-    all_phones_by_date = {}
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def admin_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /export для администратора - выгрузка истории файлом.
+
+    Аргументы (необязательные): формат csv или jsonl, одна или две даты периода
+    и статус pending (ожидают обработки) или resolved (обработаны),
+    например: /export jsonl 01.05.2025 31.05.2025 resolved
+    """
+    user_id = update.effective_user.id
     
-    for user_id_key, phones in self.phone_history.items():
-        # Получаем информацию о пользователе
-        username = self.user_data.get(user_id_key, {}).get('username', f'user_{user_id_key}')
-        user_info = f"@{username}" if username != f"user_{user_id_key}" else f"ID: {user_id_key}"
-        
-        for phone_entry in phones:
-            if phone_entry.get('pending', False):  # Пропускаем номера, ожидающие обработки
-                continue
-            if isinstance(phone_entry, dict):
-                phone = phone_entry['phone']
-                date_str = phone_entry['date']
-            else:
-                # Старый формат - только номер
-                phone = phone_entry
-                date_str = "Неизвестно"
-            
-            if date_str not in all_phones_by_date:
-                all_phones_by_date[date_str] = []
-            
-            all_phones_by_date[date_str].append({
-                'phone': phone,
-                'user_info': user_info
-            })
-    
-    # Формируем отчет, сортируя даты
-    report = "📊 История всех сданных номеров:\n\n"
-    
-    # Сортируем даты (новые сверху)
-    sorted_dates = sorted(all_phones_by_date.keys(), reverse=True)
-    
-    for date_str in sorted_dates:
-        if date_str == "Неизвестно":
-            report += f"📅 Дата неизвестна:\n"
+    # Проверяем, что это админ
+    if user_id not in self.admin_ids:
+        return  # Не отправляем никакого ответа для неадминов
+    
+    export_format = 'csv'
+    dates = []
+    pending = None
+    for arg in context.args or []:
+        value = arg.lower()
+        date_str = parse_check_date(arg)
+        if value in EXPORT_FORMATS:
+            export_format = value
+        elif value in ('pending', 'resolved'):
+            pending = value == 'pending'
+        elif date_str and len(dates) < 2:
+            dates.append(date_str)
         else:
-            try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                formatted_date = date_obj.strftime('%d.%m.%Y')
-                report += f"📅 {formatted_date}:\n"
-            except:
-                report += f"📅 {date_str}:\n"
-        
-        # Группируем номера по пользователям
-        users_on_date = {}
-        for entry in all_phones_by_date[date_str]:
-            user_info = entry['user_info']
-            if user_info not in users_on_date:
-                users_on_date[user_info] = []
-            users_on_date[user_info].append(entry['phone'])
-        
-        for user_info, phones in users_on_date.items():
-            report += f"   👤 {user_info}:\n"
-            for phone in phones:
-                report += f"      +{phone}\n"
-            report += "\n"  # Пустая строка между пользователями
-        
-        report += "\n"  # Пустая строка между датами
+            await update.message.reply_text(
+                "❌ Неверные параметры.\n"
+                "Использование: /export [csv|jsonl] [дата] [дата по] [pending|resolved]\n"
+                "Например: /export jsonl 01.05.2025 31.05.2025 resolved"
+            )
+            return
+    date_from = min(dates) if dates else None
+    date_to = max(dates) if dates else None
     
-    # Разбиваем длинное сообщение на части (Telegram лимит ~4096 символов)
-    if len(report) > 4000:
-        parts = []
-        current_part = "📊 История всех сданных номеров:\n\n"
-        
-        for date_str in sorted_dates:
-            date_block = ""
-            if date_str == "Неизвестно":
-                date_block += f"📅 Дата неизвестна:\n"
-            else:
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                    formatted_date = date_obj.strftime('%d.%m.%Y')
-                    date_block += f"📅 {formatted_date}:\n"
-                except:
-                    date_block += f"📅 {date_str}:\n"
-            
-            users_on_date = {}
-            for entry in all_phones_by_date[date_str]:
-                user_info = entry['user_info']
-                if user_info not in users_on_date:
-                    users_on_date[user_info] = []
-                users_on_date[user_info].append(entry['phone'])
-            
-            for user_info, phones in users_on_date.items():
-                date_block += f"   👤 {user_info}:\n"
-                for phone in phones:
-                    date_block += f"      +{phone}\n"
-                date_block += "\n"  # Пустая строка между пользователями
-            
-            date_block += "\n"  # Пустая строка между датами
-            
-            if len(current_part + date_block) > 4000:
-                parts.append(current_part)
-                current_part = date_block
-            else:
-                current_part += date_block
-        
-        parts.append(current_part)
-        
-        for part in parts:
-            await update.message.reply_text(part)
-    else:
-        await update.message.reply_text(report)
+    try:
+        buffer, count = await build_export(self.storage, export_format, date_from, date_to, pending)
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки истории: {e}")
+        await update.message.reply_text("❌ Не удалось сформировать выгрузку.")
+        return
+    
+    with buffer:
+        if count == 0:
+            await update.message.reply_text("📋 Нет номеров по заданному фильтру.")
+            return
+        filename = f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}.gz"
+        # Файл не читается в память целиком: HTTP-клиент отправляет его частями
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=InputFile(buffer, filename=filename, read_file_handle=False),
+            caption=f"📦 Выгрузка истории: {count} записей"
+        )
+
+async def admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /stats для администратора - задержки обработчиков, запросы к Bot API и очередь"""
+    if update.effective_user.id not in self.admin_ids:
+        return  # Не отправляем никакого ответа для неадминов
+    await update.message.reply_text(self.metrics.report())
 
 async def admin_call(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /call для администратора - рассылка сообщения всем пользователям"""
@@ -714,51 +796,48 @@ async def admin_call(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Пожалуйста, укажите текст для рассылки. Пример: /call Важное объявление!")
         return
     
+    # Одновременно идет только одна рассылка
+    if self.broadcaster.is_running():
+        await update.message.reply_text("⏳ Предыдущая рассылка еще не завершена.")
+        return
+    
     # Формируем сообщение с префиксом "Администратор:"
     full_message = f"Администратор:\n{message_text}"
     
-    # Отправляем сообщение всем пользователям из user_data
-    sent_count = 0
-    failed_count = 0
-    for target_user_id in self.user_data.keys():
-        try:
-            await self.app.bot.send_message(target_user_id, full_message)
-            sent_count += 1
-        except Exception as e:
-            print(f"Ошибка отправки сообщения пользователю {target_user_id}: {e}")
-            failed_count += 1
-    
-    # Уведомляем админа о результате
-    await update.message.reply_text(
-        f"📢 Рассылка завершена:\n"
-        f"✅ Отправлено: {sent_count} пользователям\n"
-        f"❌ Не удалось отправить: {failed_count} пользователям"
-    )
+    # Рассылка идет в фоне; прогресс обновляется в этом сообщении, итоги придут отдельно
+    progress_message = await update.message.reply_text("📢 Рассылка запущена...")
+    self.broadcaster.start(full_message, user_id, progress_message.message_id)
 
 def setup_handlers(bot):
     """Настройка обработчиков команд и сообщений"""
     bot.group_chat_id = None
-    bot.user_states = {}
-    bot.user_data = {}
-    bot.phone_queue = []
-    bot.processing_user = None
-    bot.processing_admin = None  # Добавляем для хранения ID админа, который взял номер
-    bot.phone_history = {}
-    bot.pending_admin_reply = None
+    bot.phone_queue = PhoneQueue()
     bot.db_dir = "bd"
-    bot.db_file = os.path.join(bot.db_dir, "phones_history.json")
     
     if not os.path.exists(bot.db_dir):
         os.makedirs(bot.db_dir)
     
-    bot.phone_history = load_history(bot.db_file)
-    
-    bot.app.add_handler(CommandHandler("start", lambda update, context: start(bot, update, context)))
-    bot.app.add_handler(CommandHandler("check", lambda update, context: admin_check(bot, update, context)))
-    bot.app.add_handler(CommandHandler("call", lambda update, context: admin_call(bot, update, context)))
-    bot.app.add_handler(CallbackQueryHandler(lambda update, context: button_callback(bot, update, context)))
-    bot.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lambda update, context: handle_text(bot, update, context)))
-    bot.app.add_handler(MessageHandler(filters.PHOTO, lambda update, context: handle_photo(bot, update, context)))
+    # Хранилище открывается в post_init, вне цикла событий
+    bot.storage = create_storage(bot.storage_backend, bot.db_dir)
+    bot.user_states = UserStates(bot.storage)
+    bot.user_data = UserDataMap(bot.storage)
+    bot.callback_router = build_callback_router(bot.metrics)
+    
+    bot.app.add_handler(CommandHandler("start", instrumented(bot, "start", start)))
+    bot.app.add_handler(CommandHandler("check", instrumented(bot, "check", admin_check)))
+    bot.app.add_handler(CommandHandler("call", instrumented(bot, "call", admin_call)))
+    bot.app.add_handler(CommandHandler("export", instrumented(bot, "export", admin_export)))
+    bot.app.add_handler(CommandHandler("stats", instrumented(bot, "stats", admin_stats)))
+    bot.app.add_handler(CallbackQueryHandler(instrumented(bot, "button_callback", button_callback)))
+    bot.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrumented(bot, "handle_text", handle_text)))
+    bot.app.add_handler(MessageHandler(filters.PHOTO, instrumented(bot, "handle_photo", handle_photo)))
+
+def instrumented(bot, name: str, handler):
+    """Обработчик для PTB: handler(bot, update, context) с замером времени и учетом ошибок"""
+    async def callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with bot.metrics.measure(HANDLER_SECONDS, HANDLER_ERRORS, handler=name):
+            await handler(bot, update, context)
+    return callback
 
 async def start(bot, update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -766,6 +845,7 @@ async def start(bot, update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Проверяем, не админ ли это
     if user_id in bot.admin_ids:
+        bot.support.touch(user_id)
         await update.message.reply_text("👋 Добро пожаловать в бота для сдачи WhatsApp!\n🤖 @xvcenWhatsApp_Bot\n\n👨‍💼 Вы вошли как администратор. Ожидайте номеров от пользователей.")
         return
     
@@ -781,16 +861,8 @@ async def start(bot, update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_subscribed = await check_subscription(bot, user_id)
     
     if is_subscribed:
-        # Удаляем предыдущее сообщение с проверкой подписки, если оно есть
-        if user_id in bot.user_data and 'subscription_message_id' in bot.user_data[user_id]:
-            try:
-                await context.bot.delete_message(
-                    chat_id=update.effective_chat.id,
-                    message_id=bot.user_data[user_id]['subscription_message_id']
-                )
-            except:
-                pass
-            bot.user_data[user_id].pop('subscription_message_id', None)
+        # Предыдущее сообщение с проверкой подписки, если оно есть, удаляется в фоне
+        bot.cleanup.schedule(update.effective_chat.id, [bot.user_data[user_id].pop('subscription_message_id', None)])
         await show_main_menu(bot, update, context)
     else:
         await show_subscription_check(bot, update, context)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+class _Lane:
+    __slots__ = ('lock', 'waiters')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0  # Сколько обновлений сейчас держат или ждут эту полосу
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с последовательной полосой на каждого пользователя.
+
+    Обновления разных пользователей (и админов) обрабатываются одновременно,
+    обновления одного пользователя - строго по одному в порядке поступления,
+    поэтому переходы user_states и операции с очередью одного чата не
+    перемешиваются. Полоса занимается до общего лимита одновременных
+    обновлений: ожидающие своей очереди обновления одного пользователя не
+    отнимают слоты у остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._lanes = {}  # user_id -> _Lane, удаляется, когда обновлений пользователя не осталось
+
+    @staticmethod
+    def lane_key(update):
+        if not hasattr(update, 'effective_user'):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update, coroutine):
+        key = self.lane_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.waiters += 1
+        try:
+            async with lane.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            lane.waiters -= 1
+            if lane.waiters == 0:
+                del self._lanes[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
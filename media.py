@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+META_KEY = 'media_file_ids'
+
+class MediaCache:
+    """Кэш file_id загруженных в Telegram файлов из assets.
+
+    Каждый файл загружается один раз; file_id сохраняется в хранилище вместе
+    с размером и временем изменения файла, чтобы замена картинки в assets
+    приводила к повторной загрузке. Если Telegram отклоняет сохраненный
+    file_id, файлы загружаются заново.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._file_ids = None  # path -> {'file_id', 'size', 'mtime'}, читается из хранилища при первом обращении
+        self._upload_lock = asyncio.Lock()
+
+    def _entries(self) -> dict:
+        if self._file_ids is None:
+            self._file_ids = self.bot.storage.get_meta(META_KEY) or {}
+        return self._file_ids
+
+    def _cached_file_id(self, path: str):
+        entry = self._entries().get(path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return entry['file_id']  # Файла нет на диске, но в Telegram он остался
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            return None
+        return entry['file_id']
+
+    def _remember(self, paths, messages):
+        entries = self._entries()
+        for path, message in zip(paths, messages):
+            if not message.photo:
+                continue
+            stat = os.stat(path)
+            # Самый большой размер фото - исходное изображение
+            entries[path] = {'file_id': message.photo[-1].file_id, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        self.bot.storage.set_meta(META_KEY, entries)
+
+    def invalidate(self, paths):
+        entries = self._entries()
+        for path in paths:
+            entries.pop(path, None)
+        self.bot.storage.set_meta(META_KEY, entries)
+
+    async def send_photo_group(self, tg_bot, chat_id: int, paths):
+        """Отправка альбома из файлов assets; возвращает отправленные сообщения"""
+        paths = list(paths)
+        file_ids = [self._cached_file_id(path) for path in paths]
+        if all(file_ids):
+            try:
+                return await tg_bot.send_media_group(
+                    chat_id=chat_id,
+                    media=[InputMediaPhoto(media=file_id) for file_id in file_ids]
+                )
+            except BadRequest as e:
+                logger.warning(f"Сохраненные file_id отклонены, загружаем файлы заново: {e}")
+                self.invalidate(paths)
+        return await self._upload(tg_bot, chat_id, paths)
+
+    async def _upload(self, tg_bot, chat_id: int, paths):
+        # Одновременные первые отправки не загружают одни и те же файлы несколько раз
+        async with self._upload_lock:
+            file_ids = [self._cached_file_id(path) for path in paths]
+            media = []
+            for path, file_id in zip(paths, file_ids):
+                if file_id:
+                    media.append(InputMediaPhoto(media=file_id))
+                else:
+                    with open(path, 'rb') as photo_file:
+                        media.append(InputMediaPhoto(media=photo_file.read()))
+            messages = await tg_bot.send_media_group(chat_id=chat_id, media=media)
+            self._remember(paths, messages)
+            return messages
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from ratelimit import PRIORITY_CLEANUP, PRIORITY_NOTIFY
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов к Bot API одновременно выполняется при рассылке по нескольким чатам
+FANOUT_CONCURRENCY = 10
+# Ограничение Bot API на число сообщений в одном deleteMessages
+DELETE_BATCH_SIZE = 100
+# Удаление старых сообщений пропускает вперед ответы пользователям и рассылку
+CLEANUP_LIMIT = {'priority': PRIORITY_CLEANUP}
+# Предложения номеров админам уступают их собственным ответам в том же чате
+NOTIFY_LIMIT = {'priority': PRIORITY_NOTIFY}
+# Сколько секунд копить удаления перед отправкой: за это время обработчик успевает ответить
+CLEANUP_DELAY = 0.5
+
+async def fan_out(coros, limit=FANOUT_CONCURRENCY):
+    """Параллельное выполнение корутин с ограничением одновременных запросов.
+
+    Ошибка одного вызова не прерывает остальные: вместо результата
+    возвращается исключение, порядок результатов совпадает с порядком корутин.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            try:
+                return await coro
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+async def delete_messages(bot, chat_id: int, message_ids):
+    """Удаление сообщений в одном чате: пачкой через deleteMessages, если метод доступен"""
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return
+    if len(message_ids) == 1 or not hasattr(bot, 'delete_messages'):
+        results = await fan_out(
+            bot.delete_message(chat_id=chat_id, message_id=message_id, rate_limit_args=CLEANUP_LIMIT)
+            for message_id in message_ids
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка удаления сообщения в чате {chat_id}: {result}")
+        return
+    for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        try:
+            await bot.delete_messages(
+                chat_id=chat_id, message_ids=message_ids[start:start + DELETE_BATCH_SIZE], rate_limit_args=CLEANUP_LIMIT
+            )
+        except Exception as e:
+            logger.error(f"Ошибка удаления сообщений в чате {chat_id}: {e}")
+
+class CleanupQueue:
+    """Отложенное удаление старых сообщений пачками по чатам.
+
+    Обработчик только ставит сообщения в очередь и сразу отвечает пользователю;
+    фоновая задача через delay секунд удаляет все накопленное по каждому чату
+    одним deleteMessages с низким приоритетом. При остановке очередь дочищается.
+    """
+
+    def __init__(self, bot, delay=CLEANUP_DELAY):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}  # chat_id -> [message_id, ...]
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+
+    def __len__(self):
+        return sum(len(message_ids) for message_ids in self._pending.values())
+
+    def start(self):
+        """Запуск фонового удаления (внутри цикла событий)"""
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        if self._pending:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с удалением всего, что осталось в очереди.
+
+        Задача не отменяется: отмена посреди flush() потеряла бы уже забранную пачку.
+        """
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def schedule(self, chat_id: int, message_ids):
+        """Поставить сообщения чата в очередь на удаление; пустые ID пропускаются"""
+        message_ids = [message_id for message_id in message_ids if message_id]
+        if not message_ids:
+            return
+        self._pending.setdefault(chat_id, []).extend(message_ids)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Удаление всего накопленного: чаты параллельно, внутри чата - пачками"""
+        pending, self._pending = self._pending, {}
+        if pending:
+            await fan_out(
+                delete_messages(self.bot.app.bot, chat_id, message_ids)
+                for chat_id, message_ids in pending.items()
+            )
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Копим удаления, пока обработчики отправляют ответы
+                await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка фонового удаления сообщений: {e}")
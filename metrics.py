@@ -0,0 +1,269 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Имена метрик
+HANDLER_SECONDS = 'bot_handler_seconds'
+HANDLER_ERRORS = 'bot_handler_errors_total'
+CALLBACK_SECONDS = 'bot_callback_seconds'
+CALLBACK_ERRORS = 'bot_callback_errors_total'
+API_SECONDS = 'bot_api_request_seconds'
+API_ERRORS = 'bot_api_errors_total'
+API_THROTTLE_SECONDS = 'bot_api_throttle_seconds'
+API_RETRIES = 'bot_api_retries_total'
+QUEUE_WAIT_SECONDS = 'bot_queue_wait_seconds'
+QUEUE_DEPTH = 'bot_queue_depth'
+QUEUE_OLDEST_WAIT = 'bot_queue_oldest_wait_seconds'
+CLEANUP_PENDING = 'bot_cleanup_pending_messages'
+ASSIGNMENTS_RECLAIMED = 'bot_assignments_reclaimed_total'
+SUPPORT_OPEN_TICKETS = 'bot_support_open_tickets'
+SUPPORT_RESPONSE_SECONDS = 'bot_support_first_response_seconds'
+SUBSCRIPTION_CACHE_ENTRIES = 'bot_subscription_cache_entries'
+SUBSCRIPTION_CACHE_HITS = 'bot_subscription_cache_hits_total'
+SUBSCRIPTION_CACHE_MISSES = 'bot_subscription_cache_misses_total'
+SUBSCRIPTION_CACHE_COALESCED = 'bot_subscription_cache_coalesced_total'
+
+HELP = {
+    HANDLER_SECONDS: 'Время обработки обновления обработчиком',
+    HANDLER_ERRORS: 'Необработанные исключения в обработчиках',
+    CALLBACK_SECONDS: 'Время обработки нажатия инлайн-кнопки по маршрутам',
+    CALLBACK_ERRORS: 'Необработанные исключения в обработчиках кнопок',
+    API_SECONDS: 'Время запросов к Bot API по методам',
+    API_ERRORS: 'Ошибки запросов к Bot API по методам и кодам ответа',
+    API_THROTTLE_SECONDS: 'Ожидание в ограничителе исходящих запросов по классам приоритета',
+    API_RETRIES: 'Повторы запросов к Bot API после RetryAfter',
+    QUEUE_WAIT_SECONDS: 'Ожидание номера в очереди до взятия в работу',
+    QUEUE_DEPTH: 'Номеров в очереди',
+    QUEUE_OLDEST_WAIT: 'Сколько ждет первый номер очереди',
+    CLEANUP_PENDING: 'Сообщений в очереди на удаление',
+    ASSIGNMENTS_RECLAIMED: 'Номера, забранные у админа по истечении срока аренды',
+    SUPPORT_OPEN_TICKETS: 'Открытых обращений в поддержку',
+    SUPPORT_RESPONSE_SECONDS: 'Время от обращения в поддержку до первого ответа админа',
+    SUBSCRIPTION_CACHE_ENTRIES: 'Записей в кэше проверки подписки',
+    SUBSCRIPTION_CACHE_HITS: 'Проверки подписки, отвеченные из кэша',
+    SUBSCRIPTION_CACHE_MISSES: 'Проверки подписки, ушедшие в Bot API',
+    SUBSCRIPTION_CACHE_COALESCED: 'Проверки подписки, дождавшиеся уже идущего запроса',
+}
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам с линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # Выше последней границы точнее не оценить
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: tuple, extra=()) -> str:
+    pairs = labels + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _format_number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class Metrics:
+    """Счетчики, гистограммы и датчики бота.
+
+    Метрики хранятся в памяти процесса и отдаются командой /stats и
+    в текстовом формате Prometheus (GET /metrics на отдельном порту METRICS_PORT).
+    """
+
+    def __init__(self):
+        self._histograms = {}  # имя -> {метки: Histogram}
+        self._counters = {}  # имя -> {метки: значение}
+        self._gauges = {}  # имя -> функция без аргументов
+        self._gauge_types = {}  # имя -> тип в формате Prometheus
+        self.started_at = time.time()
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = _labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, amount=1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name: str, func, counter=False):
+        """Датчик: значение вычисляется функцией в момент чтения.
+
+        counter=True - значение только растет (счетчик, который ведет
+        другой объект), в Prometheus отдается с типом counter.
+        """
+        self._gauges[name] = func
+        self._gauge_types[name] = 'counter' if counter else 'gauge'
+
+    @contextmanager
+    def measure(self, name: str, errors: str = None, **labels):
+        """Замер времени блока в гистограмму name; исключения считаются в errors и пробрасываются"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def histograms(self, name: str):
+        """Пары (метки в виде словаря, Histogram)"""
+        return [(dict(key), histogram) for key, histogram in self._histograms.get(name, {}).items()]
+
+    def counter_total(self, name: str, **labels) -> int:
+        """Сумма счетчика по всем сериям, в метках которых есть указанные значения"""
+        wanted = set(labels.items())
+        return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for name, series in self._counters.items():
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+        for name, series in self._histograms.items():
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, func in self._gauges.items():
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {self._gauge_types[name]}")
+            lines.append(f"{name} {_format_number(func())}")
+        return "\n".join(lines) + "\n"
+
+    def _latency_lines(self, name: str, errors: str, label: str, limit: int):
+        rows = sorted(self.histograms(name), key=lambda row: row[1].count, reverse=True)
+        lines = []
+        for labels, histogram in rows[:limit]:
+            lines.append(
+                f"   {labels[label]}: {histogram.count}, "
+                f"p50 {histogram.quantile(0.5) * 1000:.0f} / p99 {histogram.quantile(0.99) * 1000:.0f} мс, "
+                f"ошибок {self.counter_total(errors, **{label: labels[label]})}"
+            )
+        return lines or ["   нет данных"]
+
+    def report(self, limit=10) -> str:
+        """Текст для команды /stats"""
+        uptime = int(time.time() - self.started_at)
+        lines = [f"📊 Статистика за {uptime // 3600} ч {uptime % 3600 // 60} мин\n"]
+        lines.append("⏱ Обработчики (вызовов, задержка, ошибок):")
+        lines.extend(self._latency_lines(HANDLER_SECONDS, HANDLER_ERRORS, 'handler', limit))
+        lines.append("\n🔘 Кнопки:")
+        lines.extend(self._latency_lines(CALLBACK_SECONDS, CALLBACK_ERRORS, 'route', limit))
+        lines.append("\n🌐 Запросы к Bot API:")
+        lines.extend(self._latency_lines(API_SECONDS, API_ERRORS, 'method', limit))
+        for labels, histogram in self.histograms(API_THROTTLE_SECONDS):
+            lines.append(
+                f"   ожидание лимита ({labels['priority']}): {histogram.count}, "
+                f"p50 {histogram.quantile(0.5) * 1000:.0f} / p99 {histogram.quantile(0.99) * 1000:.0f} мс"
+            )
+        retries = self.counter_total(API_RETRIES)
+        if retries:
+            lines.append(f"   повторов после RetryAfter: {retries}")
+        if CLEANUP_PENDING in self._gauges:
+            lines.append(f"   ждут удаления: {self._gauges[CLEANUP_PENDING]()}")
+        lines.append("\n📥 Очередь:")
+        if QUEUE_DEPTH in self._gauges:
+            lines.append(f"   номеров: {self._gauges[QUEUE_DEPTH]()}")
+        if QUEUE_OLDEST_WAIT in self._gauges:
+            lines.append(f"   первый ждет: {self._gauges[QUEUE_OLDEST_WAIT]():.0f} с")
+        for _, histogram in self.histograms(QUEUE_WAIT_SECONDS):
+            lines.append(
+                f"   взято в работу: {histogram.count}, ожидание "
+                f"p50 {histogram.quantile(0.5):.0f} / p99 {histogram.quantile(0.99):.0f} с"
+            )
+        requeued = self.counter_total(ASSIGNMENTS_RECLAIMED, outcome='requeued')
+        failed = self.counter_total(ASSIGNMENTS_RECLAIMED, outcome='failed')
+        if requeued or failed:
+            lines.append(f"   истек срок: возвращено в очередь {requeued}, не подтверждено {failed}")
+        lines.append("\n💬 Поддержка:")
+        if SUPPORT_OPEN_TICKETS in self._gauges:
+            lines.append(f"   открытых обращений: {self._gauges[SUPPORT_OPEN_TICKETS]()}")
+        for _, histogram in self.histograms(SUPPORT_RESPONSE_SECONDS):
+            lines.append(
+                f"   отвечено: {histogram.count}, до первого ответа "
+                f"p50 {histogram.quantile(0.5):.0f} / p99 {histogram.quantile(0.99):.0f} с"
+            )
+        if SUBSCRIPTION_CACHE_HITS in self._gauges:
+            hits = self._gauges[SUBSCRIPTION_CACHE_HITS]()
+            misses = self._gauges[SUBSCRIPTION_CACHE_MISSES]()
+            coalesced = self._gauges[SUBSCRIPTION_CACHE_COALESCED]()
+            total = hits + misses + coalesced
+            lines.append("\n🗂 Кэш проверки подписки:")
+            lines.append(
+                f"   записей {self._gauges[SUBSCRIPTION_CACHE_ENTRIES]()}, из кэша {hits}, запросов {misses}, "
+                f"дождались запроса {coalesced}, попаданий {(hits + coalesced) / total if total else 0:.0%}"
+            )
+        return "\n".join(lines)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который считает запросы к Bot API, их время и ошибки по методам"""
+
+    def __init__(self, metrics: Metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except TelegramError as e:
+            # Сетевые ошибки и таймауты: ответа от сервера нет
+            self.metrics.inc(API_ERRORS, method=api_method, code=type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe(API_SECONDS, time.perf_counter() - started, method=api_method)
+        if code >= 400:
+            self.metrics.inc(API_ERRORS, method=api_method, code=code)
+        return code, payload
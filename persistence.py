@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Окно склейки: записи, пришедшие за это время, сбрасываются на диск одним fsync
+COALESCE_DELAY = 0.02
+# Максимальный размер одной пачки записей
+MAX_BATCH = 1000
+
+class PersistenceWriter:
+    """Фоновый поток записи на диск, не блокирующий цикл событий бота.
+
+    Записи передаются в приемник (sink) с методами write(item) и sync().
+    Близкие по времени записи склеиваются в одну пачку с единственным sync().
+    Если приемник умеет откатывать пачку (rollback), при ошибке записи
+    повторяются по одной и ошибку получает только future сбойной записи.
+    """
+
+    def __init__(self, sink, coalesce_delay=COALESCE_DELAY, name='persistence-writer'):
+        self.sink = sink
+        self.coalesce_delay = coalesce_delay
+        self.name = name
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._last_future = None
+        self._thread = None
+
+    def start(self):
+        """Запуск потока записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """Постановка записи в очередь.
+
+        Возвращает future, который завершается после сброса записи на диск.
+        Внутри цикла событий future можно ожидать через await.
+        """
+        future = Future()
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Поток записи уже остановлен")
+            self._items.append((item, future))
+            self._last_future = future
+            self._cond.notify()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return future
+        return asyncio.wrap_future(future)
+
+    async def flush(self):
+        """Ожидание сброса на диск всех ранее поставленных записей"""
+        with self._cond:
+            last_future = self._last_future
+        if last_future is not None and not last_future.done():
+            await asyncio.wrap_future(last_future)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closing:
+                    self._cond.wait()
+                if not self._items and self._closing:
+                    return
+                closing = self._closing
+            if not closing and self.coalesce_delay:
+                # Даем соседним записям попасть в ту же пачку
+                time.sleep(self.coalesce_delay)
+            with self._cond:
+                batch = [self._items.popleft() for _ in range(min(len(self._items), MAX_BATCH))]
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        try:
+            for item, _ in batch:
+                self.sink.write(item)
+            self.sink.sync()
+        except Exception as e:
+            # Незавершенную пачку откатываем, если приемник это поддерживает
+            rollback = getattr(self.sink, 'rollback', None)
+            if rollback is not None:
+                rollback()
+                if len(batch) > 1:
+                    # Откачена вся пачка: повторяем записи по одной, чтобы ошибка одной
+                    # не отменила остальные, не связанные с ней записи
+                    logger.warning(f"Ошибка записи пачки из {len(batch)} ({self.name}): {e}, повтор по одной")
+                    for entry in batch:
+                        self._write_batch([entry])
+                    return
+            logger.error(f"Ошибка записи на диск ({self.name}): {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for _, future in batch:
+            future.set_result(None)
+
+    def close(self):
+        """Остановка с дозаписью всех накопленных записей"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime
+
+# Результаты проверки повтора
+DUPLICATE_PENDING = 'pending'  # Номер сейчас в очереди или в обработке
+DUPLICATE_RECENT = 'recent'  # Номер обработан недавно, окно повторной сдачи не прошло
+
+class PhoneRecord:
+    """Сводка сдач одного номера для проверки повтора"""
+    __slots__ = ('user_id', 'count', 'pending', 'last_resolved')
+
+    def __init__(self):
+        self.user_id = None  # Кто сдал номер последним
+        self.count = 0  # Сколько раз номер сдавался
+        self.pending = 0  # Сколько сдач ожидают обработки
+        self.last_resolved = None  # Время последней обработки
+
+class PhoneIndex:
+    """Индекс номер -> сдачи номера для проверки повторов за O(1).
+
+    Строится по истории при запуске и обновляется при добавлении и
+    подтверждении номеров.
+    """
+
+    def __init__(self, cooldown: float):
+        self.cooldown = cooldown  # Сколько секунд после обработки номер нельзя сдать повторно
+        self._records = {}  # phone -> PhoneRecord
+        self._pending = {}  # user_id -> номера пользователя, ожидающие обработки
+
+    def add(self, user_id: int, phone_entry):
+        if isinstance(phone_entry, dict):
+            phone = phone_entry['phone']
+            timestamp = self._timestamp(phone_entry)
+            pending = phone_entry.get('pending', False)
+        else:
+            # Старый формат - только номер, время сдачи неизвестно
+            phone, timestamp, pending = phone_entry, None, False
+        record = self._records.get(phone)
+        if record is None:
+            record = self._records[phone] = PhoneRecord()
+        record.user_id = user_id
+        record.count += 1
+        if pending:
+            record.pending += 1
+            self._pending.setdefault(user_id, []).append(phone)
+        elif timestamp is not None and (record.last_resolved is None or timestamp > record.last_resolved):
+            # Для записей из истории время обработки неизвестно - считаем от времени сдачи
+            record.last_resolved = timestamp
+
+    @staticmethod
+    def _timestamp(phone_entry):
+        try:
+            if phone_entry.get('datetime'):
+                return datetime.fromisoformat(phone_entry['datetime']).timestamp()
+            if phone_entry.get('date'):
+                return datetime.strptime(phone_entry['date'], '%Y-%m-%d').timestamp()
+        except ValueError:
+            pass
+        return None
+
+    def resolve(self, user_id: int):
+        """Номера пользователя обработаны: с этого момента отсчитывается окно повторной сдачи"""
+        now = time.time()
+        for phone in self._pending.pop(user_id, ()):
+            record = self._records[phone]
+            record.pending -= 1
+            record.last_resolved = now
+
+    def __contains__(self, phone):
+        return phone in self._records
+
+    def get(self, phone: str):
+        return self._records.get(phone)
+
+    def check(self, phone: str, now: float = None):
+        """Повтор номера: DUPLICATE_PENDING, DUPLICATE_RECENT или None"""
+        record = self._records.get(phone)
+        if record is None:
+            return None
+        if record.pending:
+            return DUPLICATE_PENDING
+        now = now if now is not None else time.time()
+        if record.last_resolved is not None and now - record.last_resolved < self.cooldown:
+            return DUPLICATE_RECENT
+        return None
+
+    def available_at(self, phone: str):
+        """Когда номер можно будет сдать повторно (время в секундах) или None"""
+        record = self._records.get(phone)
+        if record is None or record.last_resolved is None:
+            return None
+        return record.last_resolved + self.cooldown
@@ -0,0 +1,129 @@
+import time
+from collections import OrderedDict
+
+class QueueEntry:
+    """Номер в очереди на обработку"""
+
+    __slots__ = ('user_id', 'username', 'phone', 'timestamp', 'seq')
+
+    def __init__(self, user_id: int, username: str, phone: str, timestamp: float = None):
+        self.user_id = user_id
+        self.username = username
+        self.phone = phone
+        self.timestamp = time.time() if timestamp is None else timestamp  # Время постановки в очередь, unix-время
+        self.seq = 0  # Порядковый номер в очереди, назначается PhoneQueue
+
+    @property
+    def date(self) -> str:
+        return time.strftime('%Y-%m-%d', time.localtime(self.timestamp))
+
+    def __repr__(self):
+        return f"QueueEntry(user_id={self.user_id}, phone={self.phone!r}, seq={self.seq})"
+
+class _Fenwick:
+    """Дерево Фенвика с дозаписью в конец: префиксные суммы за O(log n)"""
+
+    __slots__ = ('_tree',)
+
+    def __init__(self):
+        self._tree = [0]  # Индексация с 1
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def append(self, value: int):
+        i = len(self._tree)
+        total = value
+        # Узел i покрывает отрезок (i - lowbit(i), i], досуммируем уже имеющиеся элементы
+        j = i - 1
+        stop = i - (i & -i)
+        while j > stop:
+            total += self._tree[j]
+            j -= j & -j
+        self._tree.append(total)
+
+    def add(self, i: int, delta: int):
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        tree = self._tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+class PhoneQueue:
+    """Очередь номеров: порядок FIFO и индекс по user_id.
+
+    Поиск и удаление по user_id - O(1), позиция в очереди - O(log n).
+    У пользователя в очереди не больше одного номера: повторная постановка
+    заменяет прежний номер и ставит пользователя в конец.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = OrderedDict()  # user_id -> QueueEntry в порядке постановки
+        self._live = _Fenwick()  # 1 для seq, который еще в очереди
+        for entry in entries:
+            self.push(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+    def get(self, user_id: int):
+        return self._entries.get(user_id)
+
+    def peek(self):
+        """Первый номер в очереди без извлечения"""
+        for entry in self._entries.values():
+            return entry
+        return None
+
+    def push(self, entry: QueueEntry):
+        """Постановка номера в конец очереди"""
+        self.remove(entry.user_id)
+        self._live.append(1)
+        entry.seq = len(self._live)
+        self._entries[entry.user_id] = entry
+
+    def remove(self, user_id: int):
+        """Удаление номера пользователя; возвращает запись или None"""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._live.add(entry.seq, -1)
+            self._maybe_rebuild()
+        return entry
+
+    def popleft(self):
+        """Извлечение первого номера очереди"""
+        if not self._entries:
+            return None
+        return self.remove(next(iter(self._entries)))
+
+    def position(self, user_id: int):
+        """Позиция пользователя в очереди, начиная с 1, или None"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._live.prefix(entry.seq)
+
+    def _maybe_rebuild(self):
+        # Удаленные seq остаются в дереве; когда их становится слишком много, перенумеровываем
+        if len(self._live) > 4 * len(self._entries) + 1024 or not self._entries:
+            entries = list(self._entries.values())
+            self._live = _Fenwick()
+            for entry in entries:
+                self._live.append(1)
+                entry.seq = len(self._live)
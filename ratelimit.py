@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import API_RETRIES, API_THROTTLE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета исходящих запросов: меньше - раньше
+PRIORITY_INTERACTIVE = 0  # Ответы пользователям и админам
+PRIORITY_NOTIFY = 1  # Предложения новых номеров админам
+PRIORITY_BROADCAST = 2  # Рассылка /call
+PRIORITY_CLEANUP = 3  # Удаление старых сообщений
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_NOTIFY: 'notify',
+    PRIORITY_BROADCAST: 'broadcast',
+    PRIORITY_CLEANUP: 'cleanup',
+}
+
+# Лимиты Bot API: около 30 сообщений в секунду на бота, около одного в секунду
+# в личный чат (короткие всплески допустимы) и 20 в минуту в группу.
+# В личном чате по лимиту ждут только фоновые запросы: интерактивный ответ
+# берет токен в долг, и следующие уведомления и рассылка в этот чат идут позже
+OUTBOUND_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 10
+GROUP_RATE = 20 / 60
+GROUP_BURST = 5
+# Сколько раз повторять запрос после RetryAfter
+MAX_RETRIES = 3
+# Сколько чатов помнить для ограничения по чату
+MAX_CHAT_BUCKETS = 10000
+
+# Методы, на которые распространяются лимиты: общий и (для отправки) по чату
+LIMITED_ENDPOINTS = ('send', 'edit', 'delete', 'copy', 'forward', 'stop')
+CHAT_LIMITED_ENDPOINTS = ('send', 'copy', 'forward')
+
+def retry_after_seconds(retry_after) -> float:
+    """RetryAfter.retry_after бывает числом или timedelta в зависимости от версии библиотеки"""
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+class TokenBucket:
+    """Ведро токенов: в среднем не больше rate запросов в секунду, всплеск до capacity.
+
+    Ожидающие получают токены по приоритету, а не по очереди.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []  # Куча (приоритет, порядковый номер, future)
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        """Токен без ожидания: при пустом ведре уходит в долг, который гасят следующие ожидающие"""
+        now = time.monotonic()
+        if now >= self._paused_until:
+            self._refill(now)
+        self._tokens -= 1
+
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов, например по RetryAfter от Telegram"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if not self._waiters:
+            now = time.monotonic()
+            if now >= self._paused_until:
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Токен уже выдан, но ожидающий отменен - возвращаем токен
+                self._tokens = min(self.capacity, self._tokens + 1)
+            raise
+
+    async def _pump(self):
+        """Раздача токенов ожидающим по мере пополнения ведра"""
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            while self._waiters and self._tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.cancelled():
+                    continue
+                self._tokens -= 1
+                future.set_result(None)
+            if self._waiters:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def cancel(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+
+class OutboundLimiter(BaseRateLimiter):
+    """Единый ограничитель исходящих запросов к Bot API (ApplicationBuilder.rate_limiter).
+
+    Запросы на отправку, редактирование и удаление проходят через общее ведро
+    токенов; ожидающие обслуживаются по приоритету, поэтому ответы
+    пользователям не ждут рассылку и удаление старых сообщений. Отправка
+    в один чат дополнительно ограничена своим ведром, тоже с приоритетами;
+    интерактивные ответы в личный чат его лимита не ждут. На RetryAfter вся
+    отправка приостанавливается на указанное время, а запрос повторяется.
+
+    Приоритет и число повторов передаются в методах бота:
+    rate_limit_args={'priority': PRIORITY_BROADCAST, 'max_retries': 1}.
+    """
+
+    def __init__(self, rate=OUTBOUND_RATE, max_retries=MAX_RETRIES, metrics=None):
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self._chats = OrderedDict()  # chat_id -> TokenBucket, давно не использованные вытесняются
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self.bucket.cancel()
+        for bucket in self._chats.values():
+            bucket.cancel()
+
+    @staticmethod
+    def _is_group(chat_id) -> bool:
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if self._is_group(chat_id):
+                bucket = TokenBucket(GROUP_RATE, GROUP_BURST)
+            else:
+                bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                # Ожидающих вытесненного ведра дообслужит его собственная задача раздачи
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_chat(self, chat_id, bucket, priority: int):
+        if priority == PRIORITY_INTERACTIVE and not self._is_group(chat_id):
+            bucket.take()
+        else:
+            await bucket.acquire(priority)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        options = rate_limit_args or {}
+        priority = options.get('priority', PRIORITY_INTERACTIVE)
+        max_retries = options.get('max_retries', self.max_retries)
+        limited = endpoint.startswith(LIMITED_ENDPOINTS)
+        chat_id = data.get('chat_id')
+        chat_bucket = None
+        if chat_id is not None and endpoint.startswith(CHAT_LIMITED_ENDPOINTS):
+            chat_bucket = self._chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            if limited:
+                started = time.monotonic()
+                if chat_bucket is not None:
+                    await self._acquire_chat(chat_id, chat_bucket, priority)
+                await self.bucket.acquire(priority)
+                if self.metrics is not None:
+                    self.metrics.observe(
+                        API_THROTTLE_SECONDS, time.monotonic() - started,
+                        priority=PRIORITY_NAMES.get(priority, priority)
+                    )
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e.retry_after)
+                # Флуд-лимит общий для бота: приостанавливаем всю отправку
+                self.bucket.pause(seconds)
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                if self.metrics is not None:
+                    self.metrics.inc(API_RETRIES, method=endpoint)
+                logger.warning(f"RetryAfter {seconds:.0f} с на {endpoint}, повтор {attempt}/{max_retries}")
+                if not limited:
+                    await asyncio.sleep(seconds)
@@ -0,0 +1,133 @@
+import sys
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+# Сколько номеров показывать на одной странице /check (страница укладывается в лимит сообщения Telegram)
+CHECK_PAGE_SIZE = 40
+UNKNOWN_DATE = "Неизвестно"
+
+def format_date_header(date_str: str) -> str:
+    if date_str == UNKNOWN_DATE:
+        return "📅 Дата неизвестна:\n"
+    try:
+        return f"📅 {datetime.strptime(date_str, '%Y-%m-%d').strftime('%d.%m.%Y')}:\n"
+    except ValueError:
+        return f"📅 {date_str}:\n"
+
+class HistoryReport:
+    """Сводка сданных номеров для /check: дата -> пользователь -> номера.
+
+    Обновляется при добавлении и подтверждении номеров, поэтому /check не
+    перебирает всю историю. Даты хранятся отсортированными (по всем номерам
+    и по каждому пользователю), так что страница отчета строится только из
+    попавших в нее дней. Текст целого дня кэшируется и перестраивается только
+    после изменений в этом дне.
+    """
+
+    def __init__(self, user_info):
+        self.user_info = user_info  # user_id -> подпись пользователя в отчете
+        self._days = {}  # date -> {user_id: [phone, ...]}, только обработанные номера
+        self._counts = {}  # date -> число номеров за день
+        self._dates = []  # Все даты по возрастанию
+        self._user_dates = {}  # user_id -> даты пользователя по возрастанию
+        self._pending = {}  # user_id -> [(date, phone), ...], ожидающие обработки
+        self._blocks = {}  # date -> готовый текст дня
+
+    def add(self, user_id: int, phone_entry):
+        if not isinstance(phone_entry, dict):
+            # Старый формат - только номер, без даты
+            self._add_resolved(UNKNOWN_DATE, user_id, phone_entry)
+        elif phone_entry.get('pending', False):
+            # Строка даты общая для всех номеров дня
+            self._pending.setdefault(user_id, []).append((sys.intern(phone_entry['date']), phone_entry['phone']))
+        else:
+            self._add_resolved(phone_entry['date'], user_id, phone_entry['phone'])
+
+    def resolve(self, user_id: int):
+        """Номера пользователя обработаны - переносим их в отчет"""
+        for date_str, phone in self._pending.pop(user_id, ()):
+            self._add_resolved(date_str, user_id, phone)
+
+    def _add_resolved(self, date_str: str, user_id: int, phone: str):
+        day = self._days.get(date_str)
+        if day is None:
+            day = self._days[date_str] = {}
+            self._counts[date_str] = 0
+            insort(self._dates, date_str)
+        phones = day.get(user_id)
+        if phones is None:
+            phones = day[user_id] = []
+            insort(self._user_dates.setdefault(user_id, []), date_str)
+        phones.append(phone)
+        self._counts[date_str] += 1
+        self._blocks.pop(date_str, None)
+
+    def __bool__(self):
+        return bool(self._days)
+
+    def user_ids(self):
+        return self._user_dates.keys()
+
+    def _segments(self, date_from=None, date_to=None, user_id=None):
+        """Дни отчета (date, число номеров) от новых к старым с учетом фильтров"""
+        dates = self._dates if user_id is None else self._user_dates.get(user_id, [])
+        lo = bisect_left(dates, date_from) if date_from else 0
+        hi = bisect_right(dates, date_to) if date_to else len(dates)
+        if date_from or date_to:
+            # Номера без даты в выборку по периоду не попадают
+            hi = min(hi, bisect_left(dates, UNKNOWN_DATE))
+        for i in range(hi - 1, lo - 1, -1):
+            date_str = dates[i]
+            count = self._counts[date_str] if user_id is None else len(self._days[date_str][user_id])
+            yield date_str, count
+
+    def count(self, date_from=None, date_to=None, user_id=None) -> int:
+        return sum(count for _, count in self._segments(date_from, date_to, user_id))
+
+    def day_block(self, date_str: str) -> str:
+        block = self._blocks.get(date_str)
+        if block is None:
+            lines = []
+            self._render_day(lines, date_str, 0, self._counts[date_str])
+            block = self._blocks[date_str] = "".join(lines)
+        return block
+
+    def _render_day(self, lines, date_str: str, skip: int, limit: int, user_id=None) -> int:
+        """Добавление в lines номеров дня начиная с skip-го, не больше limit; возвращает число добавленных"""
+        day = self._days[date_str]
+        users = day.items() if user_id is None else [(user_id, day[user_id])]
+        lines.append(format_date_header(date_str))
+        taken = 0
+        for uid, phones in users:
+            if skip >= len(phones):
+                skip -= len(phones)
+                continue
+            chunk = phones[skip:skip + limit - taken]
+            skip = 0
+            lines.append(f"   👤 {self.user_info(uid)}:\n")
+            lines.extend(f"      +{phone}\n" for phone in chunk)
+            lines.append("\n")  # Пустая строка между пользователями
+            taken += len(chunk)
+            if taken >= limit:
+                break
+        lines.append("\n")  # Пустая строка между датами
+        return taken
+
+    def page(self, number: int, size=CHECK_PAGE_SIZE, date_from=None, date_to=None, user_id=None) -> str:
+        """Текст страницы number (с нуля): обходятся только дни до конца страницы"""
+        skip = number * size
+        lines = []
+        taken = 0
+        for date_str, count in self._segments(date_from, date_to, user_id):
+            if skip >= count:
+                skip -= count
+                continue
+            if skip == 0 and user_id is None and count <= size - taken:
+                lines.append(self.day_block(date_str))
+                taken += count
+            else:
+                taken += self._render_day(lines, date_str, skip, size - taken, user_id)
+                skip = 0
+            if taken >= size:
+                break
+        return "".join(lines)
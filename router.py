@@ -0,0 +1,95 @@
+import logging
+from contextlib import nullcontext
+from metrics import CALLBACK_ERRORS, CALLBACK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Разделитель полей в callback_data: take_phone_123, check_page_0_2025-05-01__77
+SEPARATOR = "_"
+
+def optional_int(value: str):
+    """Числовое поле callback_data, которое может быть пустым"""
+    return int(value) if value else None
+
+def optional_str(value: str):
+    return value or None
+
+class CallbackRouter:
+    """Таблица маршрутов нажатий на инлайн-кнопки.
+
+    Точные маршруты ищутся в словаре по callback_data целиком. Маршруты
+    с префиксом (take_phone_<id>) ищутся в словаре по префиксу: проверяются
+    только позиции разделителей, поэтому поиск не зависит от числа маршрутов.
+    Данные после префикса один раз разбираются в аргументы указанных типов
+    и передаются обработчику: handler(bot, update, context, *args).
+    Если передан metrics, время обработки пишется по маршрутам.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._exact = {}  # callback_data -> handler
+        self._prefixes = {}  # префикс -> (handler, типы аргументов)
+        self._prefix_depth = 0  # Наибольшее число разделителей в префиксе
+
+    def add(self, data: str, handler):
+        self._exact[data] = handler
+
+    def add_prefix(self, prefix: str, handler, *arg_types):
+        """Маршрут вида <prefix><арг1>_<арг2>...; prefix заканчивается разделителем"""
+        if not prefix.endswith(SEPARATOR):
+            raise ValueError(f"Префикс маршрута должен заканчиваться на '{SEPARATOR}': {prefix}")
+        self._prefixes[prefix] = (handler, self._make_parser(arg_types or (str,)))
+        self._prefix_depth = max(self._prefix_depth, prefix.count(SEPARATOR))
+
+    @staticmethod
+    def _make_parser(arg_types):
+        """Функция разбора данных после префикса в кортеж аргументов"""
+        if len(arg_types) == 1:
+            arg_type = arg_types[0]
+            return lambda payload: (arg_type(payload),)
+
+        def parse(payload):
+            fields = payload.split(SEPARATOR, len(arg_types) - 1)
+            if len(fields) != len(arg_types):
+                raise ValueError(f"Ожидалось полей: {len(arg_types)}, получено: {len(fields)}")
+            return tuple(arg_type(field) for arg_type, field in zip(arg_types, fields))
+        return parse
+
+    def resolve(self, data: str):
+        """Обработчик и разобранные аргументы для callback_data; (None, ()) если маршрута нет"""
+        _, handler, args = self._lookup(data)
+        return handler, args
+
+    def _lookup(self, data: str):
+        """Имя маршрута (callback_data или префикс), обработчик и аргументы"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return data, handler, ()
+        end = data.find(SEPARATOR)
+        depth = self._prefix_depth
+        while end >= 0 and depth:
+            prefix = data[:end + 1]
+            route = self._prefixes.get(prefix)
+            if route is not None:
+                handler, parse = route
+                return prefix, handler, parse(data[end + 1:])
+            end = data.find(SEPARATOR, end + 1)
+            depth -= 1
+        return None, None, ()
+
+    async def dispatch(self, bot, update, context):
+        data = update.callback_query.data or ""
+        try:
+            name, handler, args = self._lookup(data)
+        except ValueError as e:
+            logger.warning(f"Некорректная кнопка {data!r}: {e}")
+            return
+        if handler is None:
+            logger.warning(f"Нет обработчика для кнопки {data!r}")
+            return
+        if self.metrics is None:
+            measure = nullcontext()
+        else:
+            measure = self.metrics.measure(CALLBACK_SECONDS, CALLBACK_ERRORS, route=name.rstrip(SEPARATOR))
+        with measure:
+            await handler(bot, update, context, *args)
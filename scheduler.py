@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from config import UserState
+from metrics import ASSIGNMENTS_RECLAIMED, QUEUE_WAIT_SECONDS, WAIT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Период фоновой проверки очереди, секунды
+DISPATCH_SWEEP_INTERVAL = 15
+
+class DispatchScheduler:
+    """Раздача номеров из очереди свободным администраторам.
+
+    Раздача запускается сразу, когда освобождается администратор (kick),
+    и дополнительно по таймеру, чтобы номер не застрял в очереди, если
+    уведомление не дошло. Там же забираются номера с истекшей арендой:
+    без фото - возвращаются в очередь, без статуса - отмечаются как не вставшие.
+    """
+
+    def __init__(self, bot, sweep_interval=DISPATCH_SWEEP_INTERVAL):
+        self.bot = bot
+        self.sweep_interval = sweep_interval
+        self._skipped = {}  # user_id -> админы, пропустившие номер
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        """Запуск фоновой раздачи (внутри цикла событий)"""
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()  # Сразу раздаем очередь, восстановленную после перезапуска
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def kick(self):
+        """Внеочередная раздача: появилась свободная емкость"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def mark_skipped(self, user_id: int, admin_id: int):
+        """Админ пропустил номер - больше не предлагаем его этому админу"""
+        self._skipped.setdefault(user_id, set()).add(admin_id)
+
+    def record_taken(self, phone_entry):
+        """Учет времени ожидания номера, взятого в работу"""
+        self._skipped.pop(phone_entry.user_id, None)
+        wait = time.time() - phone_entry.timestamp
+        self.bot.metrics.observe(QUEUE_WAIT_SECONDS, wait, buckets=WAIT_BUCKETS)
+
+    def oldest_wait(self) -> float:
+        """Сколько секунд ждет первый номер очереди"""
+        phone_entry = self.bot.phone_queue.peek()
+        return time.time() - phone_entry.timestamp if phone_entry else 0.0
+
+    async def dispatch(self):
+        """Предложение каждому свободному администратору первого номера очереди, который он не пропустил.
+
+        Очередь просматривается один раз для всех админов: проход идет, пока
+        есть админы без предложения, а не заново для каждого админа.
+        """
+        bot = self.bot
+        waiting = set(bot.assignments.idle_admins(bot.admin_ids))
+        offers = []
+        for phone_entry in bot.phone_queue:
+            if not waiting:
+                break
+            # Админам, которым номер уже предложен, новый не нужен, пока они не решат
+            waiting.difference_update(bot.admin_messages.get(phone_entry.user_id, ()))
+            targets = waiting.difference(self._skipped.get(phone_entry.user_id, ()))
+            if targets:
+                offers.append(bot.offer_phone(phone_entry, targets))
+                waiting -= targets
+        await asyncio.gather(*offers)
+
+    async def reclaim_expired(self):
+        """Обработка номеров, у которых истек срок аренды"""
+        expired = self.bot.assignments.pop_expired()
+        if expired:
+            self.bot.save_assignments()
+        for assignment in expired:
+            self.bot.admin_messages.pop(assignment.user_id, None)
+            try:
+                if assignment.photo_sent:
+                    await self._fail_stalled(assignment)
+                else:
+                    await self._requeue_stalled(assignment)
+            except Exception as e:
+                logger.error(f"Ошибка возврата номера пользователя {assignment.user_id}: {e}")
+
+    async def _requeue_stalled(self, assignment):
+        """Админ не отправил фото вовремя - номер возвращается в очередь"""
+        bot = self.bot
+        phone_entry = assignment.entry
+        bot.phone_queue.push(phone_entry)
+        bot.storage.enqueue(phone_entry)
+        bot.user_states[phone_entry.user_id] = UserState.WAITING_IN_QUEUE
+        # Этому админу номер повторно не предлагаем
+        self.mark_skipped(phone_entry.user_id, assignment.admin_id)
+        bot.metrics.inc(ASSIGNMENTS_RECLAIMED, outcome='requeued')
+        logger.info(f"Номер пользователя {phone_entry.user_id} возвращен в очередь: админ {assignment.admin_id} не отправил фото")
+        try:
+            await bot.app.bot.send_message(
+                assignment.admin_id,
+                f"⏰ Время на обработку номера {phone_entry.phone} истекло, номер возвращен в очередь."
+            )
+        except Exception as e:
+            logger.error(f"Ошибка уведомления админа {assignment.admin_id}: {e}")
+        try:
+            await bot.app.bot.send_message(
+                phone_entry.user_id,
+                "⏳ Обработка вашего номера не началась вовремя, номер возвращен в очередь."
+            )
+        except Exception as e:
+            logger.error(f"Ошибка уведомления пользователя {phone_entry.user_id}: {e}")
+        idle_admins = [admin_id for admin_id in bot.assignments.idle_admins(bot.admin_ids) if admin_id != assignment.admin_id]
+        await bot.offer_phone(phone_entry, idle_admins)
+
+    async def _fail_stalled(self, assignment):
+        """Пользователь не подтвердил статус вовремя - номер отмечается как не вставший"""
+        bot = self.bot
+        user_id = assignment.user_id
+        bot.storage.resolve_history(user_id)
+        bot.history_report.resolve(user_id)
+        bot.phone_index.resolve(user_id)
+        bot.user_states[user_id] = UserState.IDLE
+        bot.metrics.inc(ASSIGNMENTS_RECLAIMED, outcome='failed')
+        logger.info(f"Номер пользователя {user_id} отмечен как не вставший: нет подтверждения статуса")
+        try:
+            await bot.app.bot.send_message(
+                assignment.admin_id,
+                f"⏰ Пользователь не подтвердил статус номера {assignment.entry.phone}, номер отмечен как не вставший."
+            )
+        except Exception as e:
+            logger.error(f"Ошибка уведомления админа {assignment.admin_id}: {e}")
+        photo_message_id = bot.user_data.get(user_id, {}).get('photo_message_id')
+        try:
+            if photo_message_id:
+                # Убираем кнопки статуса, чтобы их нельзя было нажать после истечения срока
+                await bot.app.bot.edit_message_caption(
+                    chat_id=user_id,
+                    message_id=photo_message_id,
+                    caption="Результат обработки вашего номера:\n⏰ Время подтверждения истекло, номер не засчитан.",
+                    reply_markup=None
+                )
+            else:
+                await bot.app.bot.send_message(user_id, "⏰ Время подтверждения статуса истекло, номер не засчитан.")
+        except Exception as e:
+            logger.error(f"Ошибка уведомления пользователя {user_id}: {e}")
+
+    def _next_wakeup(self) -> float:
+        """Сколько ждать до следующего прохода: период проверки или ближайший срок аренды"""
+        timeout = self.sweep_interval
+        deadline = self.bot.assignments.next_deadline()
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, deadline - time.time()))
+        return timeout
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wakeup())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.reclaim_expired()
+                await self.dispatch()
+            except Exception as e:
+                logger.error(f"Ошибка раздачи очереди: {e}")
+            if self.bot.phone_queue:
+                logger.debug(
+                    f"Очередь: {len(self.bot.phone_queue)} номеров, "
+                    f"первый ждет {self.oldest_wait():.0f} с"
+                )
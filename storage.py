@@ -0,0 +1,708 @@
+import os
+import json
+import logging
+import sqlite3
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+from config import UserState
+from persistence import PersistenceWriter
+from phone_queue import QueueEntry
+from utils import HistoryJournal, load_history
+
+logger = logging.getLogger(__name__)
+
+class Storage:
+    """Интерфейс хранилища истории номеров, очереди, состояний и данных пользователей.
+
+    Методы записи возвращают future, завершающийся после сброса изменения на диск.
+    """
+
+    # Переживают ли перезапуск очередь, пользователи и служебные данные (meta)
+    durable_state = True
+
+    def open(self):
+        """Открытие хранилища (блокирующее, вызывается вне цикла событий)"""
+        raise NotImplementedError
+
+    def close(self):
+        """Дозапись изменений и закрытие хранилища"""
+        raise NotImplementedError
+
+    async def flush(self):
+        """Ожидание сброса на диск всех поставленных записей"""
+        raise NotImplementedError
+
+    # История номеров
+    def add_history(self, user_id: int, phone_entry: dict):
+        raise NotImplementedError
+
+    def resolve_history(self, user_id: int):
+        """Снятие флага pending со всех номеров пользователя"""
+        raise NotImplementedError
+
+    def iter_history(self):
+        """Все записи истории в виде пар (user_id, запись)"""
+        raise NotImplementedError
+
+    def export_history(self, date_from=None, date_to=None, pending=None):
+        """Записи истории для выгрузки: кортежи (user_id, username, phone, date, datetime, pending).
+
+        Генератор можно обходить в отдельном потоке. Записи без даты не попадают
+        в выборку по периоду; pending=None - все записи.
+        """
+        raise NotImplementedError
+
+    # Пользователи
+    def get_state(self, user_id: int):
+        raise NotImplementedError
+
+    def set_state(self, user_id: int, state):
+        raise NotImplementedError
+
+    def get_user_data(self, user_id: int):
+        raise NotImplementedError
+
+    def set_user_data(self, user_id: int, data: dict):
+        raise NotImplementedError
+
+    def delete_user_data(self, user_id: int):
+        """Удаление данных пользователя и исключение его из аудитории рассылки"""
+        raise NotImplementedError
+
+    def iter_user_ids(self):
+        """ID всех пользователей, у которых есть данные (аудитория рассылки)"""
+        raise NotImplementedError
+
+    def find_users_by_username(self, username: str):
+        """ID пользователей с данным username без учета регистра, по индексу"""
+        raise NotImplementedError
+
+    # Очередь номеров
+    def load_queue(self):
+        raise NotImplementedError
+
+    def enqueue(self, phone_entry: dict):
+        raise NotImplementedError
+
+    def dequeue(self, user_id: int):
+        raise NotImplementedError
+
+    # Служебные значения
+    def get_meta(self, key: str, default=None):
+        raise NotImplementedError
+
+    def set_meta(self, key: str, value):
+        raise NotImplementedError
+
+def _done():
+    """Уже завершенный future для изменений, которые не пишутся на диск"""
+    future = Future()
+    future.set_result(None)
+    return future
+
+# Время в записях истории хранится целым числом микросекунд от этой точки, без учета часового пояса:
+# так локальное время из 'datetime' восстанавливается без потерь
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+class HistoryEntry:
+    """Компактная запись истории в памяти JsonStorage.
+
+    Вместо словаря с двумя строками даты хранится одно целое число;
+    'date' и 'datetime' восстанавливаются из него при чтении.
+    """
+
+    __slots__ = ('phone', 'timestamp', 'pending')
+
+    def __init__(self, phone: str, timestamp: int, pending: bool):
+        self.phone = phone
+        self.timestamp = timestamp  # Микросекунды от _EPOCH
+        self.pending = pending
+
+    @classmethod
+    def from_dict(cls, phone_entry: dict):
+        """Сжатие записи-словаря; None, если дату нельзя восстановить без потерь"""
+        try:
+            moment = datetime.fromisoformat(phone_entry['datetime'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if moment.tzinfo is not None or moment.strftime('%Y-%m-%d') != phone_entry.get('date'):
+            return None
+        if set(phone_entry) - {'phone', 'date', 'datetime', 'pending'}:
+            return None
+        return cls(phone_entry['phone'], (moment - _EPOCH) // _MICROSECOND, bool(phone_entry.get('pending', False)))
+
+    @property
+    def datetime(self) -> datetime:
+        return _EPOCH + self.timestamp * _MICROSECOND
+
+    def to_dict(self) -> dict:
+        moment = self.datetime
+        return {
+            'phone': self.phone,
+            'date': moment.strftime('%Y-%m-%d'),
+            'datetime': moment.isoformat(),
+            'pending': self.pending
+        }
+
+def _compact_entry(phone_entry):
+    """Запись истории для хранения в памяти: HistoryEntry, если словарь сжимается без потерь"""
+    if isinstance(phone_entry, dict):
+        return HistoryEntry.from_dict(phone_entry) or phone_entry
+    return phone_entry
+
+class JsonStorage(Storage):
+    """История в JSON-снимке с журналом; очередь, пользователи и meta хранятся только в памяти.
+
+    Поэтому после перезапуска не продолжаются рассылка /call, открытые обращения
+    и закрепленные за админами номера - для этого нужен бэкенд sqlite.
+    """
+
+    durable_state = False
+
+    def __init__(self, db_file):
+        self.journal = HistoryJournal(db_file)
+        self.phone_history = {}
+        self._states = {}
+        self._user_data = {}
+        self._usernames = {}  # username в нижнем регистре -> {user_id, ...}
+        self._queue = {}
+        self._meta = {}
+
+    def open(self):
+        # Журнал и его сжатие работают со словарями на диске, в памяти держим компактные записи
+        self.phone_history = {
+            user_id: [_compact_entry(phone_entry) for phone_entry in phones]
+            for user_id, phones in self.journal.load().items()
+        }
+        self.journal.start()
+
+    def close(self):
+        self.journal.close()
+
+    async def flush(self):
+        await self.journal.writer.flush()
+
+    def add_history(self, user_id, phone_entry):
+        self.phone_history.setdefault(user_id, []).append(_compact_entry(phone_entry))
+        return self.journal.record_add(user_id, phone_entry)
+
+    def resolve_history(self, user_id):
+        for phone_entry in self.phone_history.get(user_id, []):
+            if isinstance(phone_entry, HistoryEntry):
+                phone_entry.pending = False
+            elif isinstance(phone_entry, dict) and phone_entry.get('pending', False):
+                phone_entry['pending'] = False
+        return self.journal.record_resolve(user_id)
+
+    def iter_history(self):
+        for user_id, phones in self.phone_history.items():
+            for phone_entry in phones:
+                yield user_id, phone_entry.to_dict() if isinstance(phone_entry, HistoryEntry) else phone_entry
+
+    def export_history(self, date_from=None, date_to=None, pending=None):
+        # История меняется в цикле событий, а генератор обходят в другом потоке:
+        # при вызове копируем только список пользователей, записи читаем по мере обхода
+        return self._export_rows(list(self.phone_history.items()), date_from, date_to, pending)
+
+    def _export_rows(self, users, date_from, date_to, pending):
+        for user_id, phones in users:
+            username = (self._user_data.get(user_id) or {}).get('username')
+            for phone_entry in phones:
+                if isinstance(phone_entry, HistoryEntry):
+                    moment = phone_entry.datetime
+                    row = (user_id, username, phone_entry.phone, moment.strftime('%Y-%m-%d'),
+                           moment.isoformat(), phone_entry.pending)
+                elif isinstance(phone_entry, dict):
+                    row = (user_id, username, phone_entry['phone'], phone_entry.get('date'),
+                           phone_entry.get('datetime'), bool(phone_entry.get('pending', False)))
+                else:
+                    row = (user_id, username, phone_entry, None, None, False)
+                if (date_from or date_to) and row[3] is None:
+                    continue
+                if (date_from and row[3] < date_from) or (date_to and row[3] > date_to):
+                    continue
+                if pending is not None and row[5] != pending:
+                    continue
+                yield row
+
+    def get_state(self, user_id):
+        return self._states.get(user_id)
+
+    def set_state(self, user_id, state):
+        self._states[user_id] = state
+        return _done()
+
+    def get_user_data(self, user_id):
+        return self._user_data.get(user_id)
+
+    def set_user_data(self, user_id, data):
+        self._unindex_username(user_id)
+        self._user_data[user_id] = dict(data)
+        username = data.get('username')
+        if username:
+            self._usernames.setdefault(username.lower(), set()).add(user_id)
+        return _done()
+
+    def delete_user_data(self, user_id):
+        self._unindex_username(user_id)
+        self._user_data.pop(user_id, None)
+        return _done()
+
+    def _unindex_username(self, user_id):
+        username = (self._user_data.get(user_id) or {}).get('username')
+        if username:
+            user_ids = self._usernames.get(username.lower())
+            if user_ids is not None:
+                user_ids.discard(user_id)
+                if not user_ids:
+                    del self._usernames[username.lower()]
+
+    def iter_user_ids(self):
+        return list(self._user_data)
+
+    def find_users_by_username(self, username):
+        return sorted(self._usernames.get(username.lower(), ()))
+
+    def load_queue(self):
+        return list(self._queue.values())
+
+    def enqueue(self, phone_entry):
+        self._queue[phone_entry.user_id] = phone_entry
+        return _done()
+
+    def dequeue(self, user_id):
+        self._queue.pop(user_id, None)
+        return _done()
+
+    def get_meta(self, key, default=None):
+        return self._meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self._meta[key] = value
+        return _done()
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    phone TEXT NOT NULL,
+    date TEXT,
+    datetime TEXT,
+    pending INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_history_user ON history(user_id, pending);
+CREATE INDEX IF NOT EXISTS idx_history_phone ON history(phone);
+CREATE INDEX IF NOT EXISTS idx_history_date ON history(date);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    state TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(lower(json_extract(data, '$.username')));
+CREATE TABLE IF NOT EXISTS phone_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Запросы с параметрами: sqlite3 кэширует подготовленные выражения по тексту запроса
+SQL_ADD_HISTORY = "INSERT INTO history (user_id, phone, date, datetime, pending) VALUES (?, ?, ?, ?, ?)"
+SQL_RESOLVE_HISTORY = "UPDATE history SET pending = 0 WHERE user_id = ? AND pending = 1"
+SQL_ITER_HISTORY = "SELECT user_id, phone, date, datetime, pending FROM history ORDER BY id"
+SQL_EXPORT_HISTORY = (
+    "SELECT h.user_id, json_extract(u.data, '$.username'), h.phone, h.date, h.datetime, h.pending "
+    "FROM history h LEFT JOIN users u ON u.user_id = h.user_id"
+)
+SQL_GET_STATE = "SELECT state FROM users WHERE user_id = ?"
+SQL_SET_STATE = (
+    "INSERT INTO users (user_id, state) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state"
+)
+SQL_GET_USER_DATA = "SELECT data FROM users WHERE user_id = ?"
+SQL_SET_USER_DATA = (
+    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data"
+)
+SQL_DELETE_USER_DATA = "UPDATE users SET data = NULL WHERE user_id = ?"
+SQL_ITER_USER_IDS = "SELECT user_id FROM users WHERE data IS NOT NULL"
+# Выражение должно совпадать с idx_users_username, иначе SQLite не использует индекс
+SQL_FIND_USERNAME = "SELECT user_id FROM users WHERE lower(json_extract(data, '$.username')) = ?"
+SQL_LOAD_QUEUE = "SELECT user_id, username, phone, timestamp, date FROM phone_queue ORDER BY seq"
+SQL_ENQUEUE = (
+    "INSERT OR REPLACE INTO phone_queue (user_id, username, phone, timestamp, date) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SQL_DEQUEUE = "DELETE FROM phone_queue WHERE user_id = ?"
+SQL_GET_META = "SELECT value FROM meta WHERE key = ?"
+SQL_SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+def _connect(path):
+    """Подключение к SQLite в режиме WAL"""
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+class _SQLiteSink:
+    """Приемник для PersistenceWriter: пачка записей выполняется одной транзакцией"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def write(self, item):
+        if self._conn is None:
+            self._conn = _connect(self.path)
+        sql, params = item
+        self._conn.execute(sql, params)
+
+    def sync(self):
+        self._conn.commit()
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class SQLiteStorage(Storage):
+    """Хранилище в SQLite: чтение из цикла событий, запись через поток PersistenceWriter"""
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._conn = None
+        self._sink = _SQLiteSink(path)
+        self.writer = PersistenceWriter(self._sink, name='sqlite-writer')
+        # username из записей, еще не дошедших до базы: user_id -> (username, future записи)
+        self._unflushed_usernames = {}
+
+    def open(self):
+        self._conn = _connect(self.path)
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._import_legacy_json()
+        self.writer.start()
+
+    def _import_legacy_json(self):
+        """Однократный перенос истории из phones_history.json"""
+        if not self.legacy_json or self.get_meta('legacy_json_imported'):
+            return
+        phone_history = load_history(self.legacy_json)
+        rows = []
+        for user_id, phones in phone_history.items():
+            for phone_entry in phones:
+                if isinstance(phone_entry, dict):
+                    rows.append((
+                        user_id, phone_entry['phone'], phone_entry.get('date'),
+                        phone_entry.get('datetime'), int(phone_entry.get('pending', False))
+                    ))
+                else:
+                    # Старый формат - только номер
+                    rows.append((user_id, phone_entry, None, None, 0))
+        with self._conn:
+            self._conn.executemany(SQL_ADD_HISTORY, rows)
+            self._conn.execute(SQL_SET_META, ('legacy_json_imported', json.dumps(True)))
+        if rows:
+            logger.info(f"Перенесено {len(rows)} записей истории из {self.legacy_json}")
+
+    def close(self):
+        self.writer.close()
+        self._sink.close()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def flush(self):
+        await self.writer.flush()
+
+    def _write(self, sql, params):
+        return self.writer.submit((sql, params))
+
+    def add_history(self, user_id, phone_entry):
+        return self._write(SQL_ADD_HISTORY, (
+            user_id, phone_entry['phone'], phone_entry['date'],
+            phone_entry['datetime'], int(phone_entry['pending'])
+        ))
+
+    def resolve_history(self, user_id):
+        return self._write(SQL_RESOLVE_HISTORY, (user_id,))
+
+    def iter_history(self):
+        for user_id, phone, date, datetime_str, pending in self._conn.execute(SQL_ITER_HISTORY):
+            if date is None:
+                yield user_id, phone
+            else:
+                yield user_id, {'phone': phone, 'date': date, 'datetime': datetime_str, 'pending': bool(pending)}
+
+    def export_history(self, date_from=None, date_to=None, pending=None):
+        conditions, params = [], []
+        if date_from:
+            conditions.append("h.date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("h.date <= ?")
+            params.append(date_to)
+        if pending is not None:
+            conditions.append("h.pending = ?")
+            params.append(int(pending))
+        sql = SQL_EXPORT_HISTORY
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY h.id"
+        # Отдельное соединение: выгрузка читает согласованный снимок WAL в своем потоке,
+        # не мешая запросам из цикла событий
+        conn = _connect(self.path)
+        try:
+            for user_id, username, phone, date, datetime_str, is_pending in conn.execute(sql, params):
+                yield user_id, username, phone, date, datetime_str, bool(is_pending)
+        finally:
+            conn.close()
+
+    def get_state(self, user_id):
+        row = self._conn.execute(SQL_GET_STATE, (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, user_id, state):
+        return self._write(SQL_SET_STATE, (user_id, state))
+
+    def get_user_data(self, user_id):
+        row = self._conn.execute(SQL_GET_USER_DATA, (user_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def set_user_data(self, user_id, data):
+        future = self._write(SQL_SET_USER_DATA, (user_id, json.dumps(data, ensure_ascii=False)))
+        return self._track_username(user_id, data.get('username'), future)
+
+    def delete_user_data(self, user_id):
+        return self._track_username(user_id, None, self._write(SQL_DELETE_USER_DATA, (user_id,)))
+
+    def _track_username(self, user_id, username, future):
+        """Поиск по username видит запись сразу, а не после сброса пачки на диск"""
+        self._unflushed_usernames[user_id] = (username, future)
+
+        def forget(_):
+            if self._unflushed_usernames.get(user_id, (None, None))[1] is future:
+                del self._unflushed_usernames[user_id]
+
+        future.add_done_callback(forget)
+        return future
+
+    def iter_user_ids(self):
+        return [row[0] for row in self._conn.execute(SQL_ITER_USER_IDS)]
+
+    def find_users_by_username(self, username):
+        username = username.lower()
+        user_ids = {row[0] for row in self._conn.execute(SQL_FIND_USERNAME, (username,))}
+        for user_id, (unflushed, _) in list(self._unflushed_usernames.items()):
+            if unflushed and unflushed.lower() == username:
+                user_ids.add(user_id)
+            else:
+                user_ids.discard(user_id)
+        return sorted(user_ids)
+
+    def load_queue(self):
+        return [
+            QueueEntry(user_id, username, phone, datetime.fromisoformat(timestamp).timestamp())
+            for user_id, username, phone, timestamp, _ in self._conn.execute(SQL_LOAD_QUEUE)
+        ]
+
+    def enqueue(self, phone_entry):
+        return self._write(SQL_ENQUEUE, (
+            phone_entry.user_id, phone_entry.username, phone_entry.phone,
+            datetime.fromtimestamp(phone_entry.timestamp).isoformat(), phone_entry.date
+        ))
+
+    def dequeue(self, user_id):
+        return self._write(SQL_DEQUEUE, (user_id,))
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute(SQL_GET_META, (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        return self._write(SQL_SET_META, (key, json.dumps(value, ensure_ascii=False)))
+
+def create_storage(backend, db_dir):
+    """Создание хранилища по имени бэкенда из STORAGE_BACKEND"""
+    json_file = os.path.join(db_dir, "phones_history.json")
+    if backend == 'json':
+        return JsonStorage(json_file)
+    if backend == 'sqlite':
+        return SQLiteStorage(os.path.join(db_dir, "bot.sqlite3"), legacy_json=json_file)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
+
+_MISSING = object()
+
+# Ключи user_data, для которых в UserRecord есть отдельные слоты; остальные попадают в _extra
+USER_DATA_FIELDS = (
+    'username',
+    'main_menu_message_id',
+    'subscription_message_id',
+    'support_message_id',
+    'queue_message_id',
+    'photo_message_id',
+    'manual_photo_ids'
+)
+_USER_DATA_FIELDS = frozenset(USER_DATA_FIELDS)
+
+class UserRecord(MutableMapping):
+    """Данные пользователя; каждое изменение сохраняется одной строкой в хранилище.
+
+    Известные ключи хранятся в слотах (незаполненный слот - отсутствующий ключ),
+    поэтому запись занимает меньше памяти, чем словарь. Прочие ключи
+    складываются в словарь _extra, который создается только при необходимости.
+    """
+
+    __slots__ = ('_storage', '_user_id', '_extra') + USER_DATA_FIELDS
+
+    def __init__(self, storage, user_id, data=()):
+        self._storage = storage
+        self._user_id = user_id
+        self._extra = None
+        for key, value in dict(data).items():
+            self._set(key, value)
+
+    def _set(self, key, value):
+        if key in _USER_DATA_FIELDS:
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def _save(self):
+        self._storage.set_user_data(self._user_id, self.to_dict())
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        if key in _USER_DATA_FIELDS:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __contains__(self, key):
+        if key in _USER_DATA_FIELDS:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key in USER_DATA_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+        self._save()
+
+    def __delitem__(self, key):
+        if key in _USER_DATA_FIELDS:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+        self._save()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self._set(key, value)
+        self._save()
+
+    def __repr__(self):
+        return f"UserRecord({self._user_id}, {self.to_dict()!r})"
+
+class UserDataMap:
+    """Словарь user_id -> данные пользователя с ленивой подгрузкой из хранилища"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._cache = {}
+
+    def _load(self, user_id):
+        record = self._cache.get(user_id, _MISSING)
+        if record is _MISSING:
+            data = self.storage.get_user_data(user_id)
+            record = UserRecord(self.storage, user_id, data) if data is not None else None
+            self._cache[user_id] = record
+        return record
+
+    def __contains__(self, user_id):
+        return self._load(user_id) is not None
+
+    def __getitem__(self, user_id):
+        record = self._load(user_id)
+        if record is None:
+            raise KeyError(user_id)
+        return record
+
+    def get(self, user_id, default=None):
+        record = self._load(user_id)
+        return default if record is None else record
+
+    def __setitem__(self, user_id, data):
+        record = UserRecord(self.storage, user_id, data)
+        self._cache[user_id] = record
+        record._save()
+
+    def __delitem__(self, user_id):
+        self._cache[user_id] = None
+        self.storage.delete_user_data(user_id)
+
+    def keys(self):
+        return self.storage.iter_user_ids()
+
+class UserStates:
+    """Словарь user_id -> UserState с ленивой подгрузкой и сквозной записью"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._cache = {}
+
+    def get(self, user_id, default=None):
+        state = self._cache.get(user_id, _MISSING)
+        if state is _MISSING:
+            value = self.storage.get_state(user_id)
+            state = UserState(value) if value is not None else None
+            self._cache[user_id] = state
+        return default if state is None else state
+
+    def __getitem__(self, user_id):
+        state = self.get(user_id)
+        if state is None:
+            raise KeyError(user_id)
+        return state
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __setitem__(self, user_id, state):
+        self._cache[user_id] = state
+        self.storage.set_state(user_id, state.value)
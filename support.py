@@ -0,0 +1,124 @@
+import logging
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from metrics import SUPPORT_RESPONSE_SECONDS, WAIT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+META_KEY = 'support'
+# Админ считается в сети, если что-то делал в боте за последние столько секунд
+SUPPORT_ONLINE_WINDOW = 15 * 60
+
+class Ticket:
+    """Открытое обращение пользователя в поддержку"""
+    __slots__ = ('user_id', 'admin_id', 'created_at')
+
+    def __init__(self, user_id: int, admin_id: int, created_at: float = None):
+        self.user_id = user_id
+        self.admin_id = admin_id
+        self.created_at = created_at if created_at is not None else time.time()
+
+class SupportDesk:
+    """Обращения в поддержку, распределенные между администраторами.
+
+    У пользователя одно открытое обращение: новые сообщения до ответа уходят
+    тому же админу. Новое обращение получает админ в сети с наименьшим числом
+    открытых обращений. У каждого админа своя сессия ответа, поэтому
+    одновременные ответы разных админов не мешают друг другу. Открытые
+    обращения и сессии сохраняются в хранилище и переживают перезапуск.
+    """
+
+    def __init__(self, bot, online_window=SUPPORT_ONLINE_WINDOW):
+        self.bot = bot
+        self.online_window = online_window
+        self.tickets = {}  # user_id -> Ticket
+        self.sessions = {}  # admin_id -> user_id, которому админ сейчас пишет ответ
+        self._last_seen = {}  # admin_id -> время последнего действия
+        self._last_assigned = {}  # admin_id -> время последнего назначенного обращения
+
+    def load(self):
+        state = self.bot.storage.get_meta(META_KEY) or {}
+        for item in state.get('tickets', []):
+            self.tickets[item['user_id']] = Ticket(item['user_id'], item['admin_id'], item['created_at'])
+        # Ключи JSON - строки
+        self.sessions = {int(admin_id): user_id for admin_id, user_id in state.get('sessions', {}).items()}
+
+    def _save(self):
+        self.bot.storage.set_meta(META_KEY, {
+            'tickets': [
+                {'user_id': ticket.user_id, 'admin_id': ticket.admin_id, 'created_at': ticket.created_at}
+                for ticket in self.tickets.values()
+            ],
+            'sessions': self.sessions
+        })
+
+    def touch(self, admin_id: int):
+        """Отметка активности админа"""
+        self._last_seen[admin_id] = time.time()
+
+    def load_by_admin(self) -> dict:
+        counts = dict.fromkeys(self.bot.admin_ids, 0)
+        for ticket in self.tickets.values():
+            if ticket.admin_id in counts:
+                counts[ticket.admin_id] += 1
+        return counts
+
+    def _candidates(self):
+        """Админы в порядке выбора: сначала в сети, затем наименее загруженные и давно получавшие обращения"""
+        now = time.time()
+        counts = self.load_by_admin()
+        online = {admin_id for admin_id in self.bot.admin_ids if now - self._last_seen.get(admin_id, 0) <= self.online_window}
+        return sorted(
+            self.bot.admin_ids,
+            key=lambda admin_id: (admin_id not in online, counts[admin_id], self._last_assigned.get(admin_id, 0))
+        )
+
+    async def submit(self, user_id: int, user_info: str, message_text: str):
+        """Передача сообщения пользователя админу; если не доставлено никому - последняя ошибка"""
+        admin_text = f"💬 Сообщение в поддержку от {user_info}:\n\n{message_text}"
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("Ответить", callback_data=f"reply_{user_id}")]])
+        ticket = self.tickets.get(user_id)
+        candidates = self._candidates()
+        if ticket is not None and ticket.admin_id in candidates:
+            # Продолжение обращения - тому же админу, он уже в контексте
+            candidates.remove(ticket.admin_id)
+            candidates.insert(0, ticket.admin_id)
+        error = RuntimeError("Нет администраторов для обращения")
+        for admin_id in candidates:
+            try:
+                await self.bot.app.bot.send_message(admin_id, admin_text, reply_markup=reply_markup)
+            except Exception as e:
+                logger.error(f"Ошибка отправки обращения админу {admin_id}: {e}")
+                error = e
+                continue
+            if ticket is None:
+                ticket = self.tickets[user_id] = Ticket(user_id, admin_id)
+            ticket.admin_id = admin_id
+            self._last_assigned[admin_id] = time.time()
+            self._save()
+            return
+        raise error
+
+    def start_reply(self, admin_id: int, user_id: int):
+        """Админ нажал "Ответить": следующее его сообщение уйдет этому пользователю"""
+        self.sessions[admin_id] = user_id
+        ticket = self.tickets.get(user_id)
+        if ticket is not None:
+            ticket.admin_id = admin_id  # Обращение переходит к ответившему админу
+        self._save()
+
+    def session(self, admin_id: int):
+        return self.sessions.get(admin_id)
+
+    async def reply(self, admin_id: int, text: str) -> bool:
+        """Отправка ответа админа пользователю из его сессии; закрывает обращение"""
+        user_id = self.sessions.get(admin_id)
+        if user_id is None:
+            return False
+        await self.bot.app.bot.send_message(user_id, f"💬 Ответ от поддержки:\n\n{text}")
+        del self.sessions[admin_id]
+        ticket = self.tickets.pop(user_id, None)
+        if ticket is not None:
+            self.bot.metrics.observe(SUPPORT_RESPONSE_SECONDS, time.time() - ticket.created_at, buckets=WAIT_BUCKETS)
+        self._save()
+        return True
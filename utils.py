@@ -1,54 +1,255 @@
 import os
 import json
 import re
+import logging
+import threading
 from datetime import datetime
+from persistence import PersistenceWriter
 
-def load_history(db_file):
-    """Загрузка истории из файла"""
+logger = logging.getLogger(__name__)
+
+# Количество записей в журнале, после которого запускается сжатие в снимок
+JOURNAL_COMPACT_EVERY = 5000
+
+def journal_path(db_file):
+    """Путь к журналу событий истории рядом с файлом снимка"""
+    return os.path.splitext(db_file)[0] + '.journal'
+
+def apply_history_event(phone_history, event):
+    """Применение одного события журнала к истории"""
+    user_id = event['uid']
+    if event['op'] == 'add':
+        phone_history.setdefault(user_id, []).append(event['e'])
+    elif event['op'] == 'resolve':
+        for phone_entry in phone_history.get(user_id, []):
+            if isinstance(phone_entry, dict) and phone_entry.get('pending', False):
+                phone_entry['pending'] = False
+
+def _read_snapshot(db_file):
+    """Чтение снимка истории, возвращает (история, номер последнего события)"""
     try:
         if os.path.exists(db_file):
             with open(db_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 phone_history = data.get('phone_history', {})
                 # Конвертируем ключи обратно в int
-                return {int(k): v for k, v in phone_history.items()}
+                return {int(k): v for k, v in phone_history.items()}, data.get('seq', 0)
     except Exception as e:
-        return {}
+        logger.error(f"Ошибка чтения снимка истории {db_file}: {e}")
+    return {}, 0
+
+def _replay_journal(path, phone_history, seq):
+    """Воспроизведение журнала поверх истории.
+
+    Возвращает (номер последнего события, смещение конца последней целой записи).
+    Оборванная при сбое последняя строка отбрасывается.
+    """
+    good_offset = 0
+    if not os.path.exists(path):
+        return seq, good_offset
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                event = json.loads(line)
+            except ValueError:
+                break
+            good_offset += len(line)
+            # События, уже вошедшие в снимок, пропускаем
+            if event['seq'] <= seq:
+                continue
+            apply_history_event(phone_history, event)
+            seq = event['seq']
+    return seq, good_offset
+
+def _read_history(db_file):
+    """Снимок + хвост журнала (включая журнал, не успевший сжаться)"""
+    phone_history, seq = _read_snapshot(db_file)
+    journal = journal_path(db_file)
+    seq, _ = _replay_journal(journal + '.old', phone_history, seq)
+    seq, good_offset = _replay_journal(journal, phone_history, seq)
+    return phone_history, seq, good_offset
 
-def save_history(db_file, phone_history):
-    """Сохранение истории в файл"""
+def load_history(db_file):
+    """Загрузка истории: снимок и воспроизведение журнала событий"""
+    phone_history, _, _ = _read_history(db_file)
+    return phone_history
+
+def save_history(db_file, phone_history, seq=0):
+    """Атомарное сохранение снимка истории в файл"""
     try:
         data = {
             'phone_history': phone_history,
+            'seq': seq,
             'last_updated': datetime.now().isoformat()
         }
-        with open(db_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp_file = db_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, db_file)
     except Exception as e:
-        pass
+        logger.error(f"Ошибка сохранения истории {db_file}: {e}")
+
+class HistoryJournal:
+    """Журнал изменений истории номеров с периодическим сжатием в снимок"""
+
+    def __init__(self, db_file, compact_every=JOURNAL_COMPACT_EVERY):
+        self.db_file = db_file
+        self.path = journal_path(db_file)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending_events = 0  # Записей в журнале с последнего сжатия
+        self._file = None
+        self._compactor = None
+        self.writer = PersistenceWriter(self, name='history-writer')
+
+    def load(self):
+        """Восстановление истории и открытие журнала на дозапись"""
+        phone_history, self.seq, good_offset = _read_history(self.db_file)
+        if os.path.exists(self.path):
+            # Отрезаем оборванный хвост, чтобы новые записи не склеились с ним
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+            with open(self.path, 'rb') as f:
+                self.pending_events = sum(1 for _ in f)
+        self._file = open(self.path, 'a', encoding='utf-8', newline='\n')
+        return phone_history
+
+    def start(self):
+        """Запуск фонового потока записи журнала"""
+        self.writer.start()
+
+    def record_add(self, user_id, phone_entry):
+        """Запись о добавленном номере; возвращает future сброса на диск"""
+        return self.writer.submit({'op': 'add', 'uid': user_id, 'e': dict(phone_entry)})
+
+    def record_resolve(self, user_id):
+        """Запись о снятии флага pending; возвращает future сброса на диск"""
+        return self.writer.submit({'op': 'resolve', 'uid': user_id})
+
+    def write(self, event):
+        """Дозапись события в журнал (вызывается из потока записи)"""
+        self.seq += 1
+        event['seq'] = self.seq
+        self._file.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.pending_events += 1
+
+    def sync(self):
+        """Сброс пачки событий на диск (вызывается из потока записи)"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self.pending_events >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Запуск фонового сжатия: журнал ротируется, снимок пересобирается в потоке"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        old_path = self.path + '.old'
+        if not os.path.exists(old_path):
+            # Ротация журнала; новые записи пойдут в свежий файл
+            self._file.close()
+            os.replace(self.path, old_path)
+            self._file = open(self.path, 'a', encoding='utf-8', newline='\n')
+            self.pending_events = 0
+        self._compactor = threading.Thread(target=self._compact_worker, name='history-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compact_worker(self):
+        """Слияние снимка и ротированного журнала в новый снимок"""
+        old_path = self.path + '.old'
+        try:
+            phone_history, seq = _read_snapshot(self.db_file)
+            seq, _ = _replay_journal(old_path, phone_history, seq)
+            save_history(self.db_file, phone_history, seq)
+            os.remove(old_path)
+        except Exception as e:
+            logger.error(f"Ошибка сжатия журнала истории: {e}")
+
+    def close(self):
+        """Дозапись очереди, ожидание фонового сжатия и закрытие журнала"""
+        self.writer.close()
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# Причины, по которым строка не принята как номер
+PHONE_EMPTY = 'empty'
+PHONE_LETTERS = 'letters'
+PHONE_LENGTH = 'length'
+PHONE_COUNTRY = 'country'
+
+# Частый случай - номер цифрами с пробелами, скобками и дефисами - разбирается одним выражением
+_PHONE_FAST = re.compile(r'\+?([78])[\s()\-]*(\d{3})[\s()\-]*(\d{3})[\s\-]*(\d{2})[\s\-]*(\d{2})')
+_PHONE_LETTERS = re.compile(r'[а-яёА-ЯЁa-zA-Z]')
+_NON_DIGITS = re.compile(r'\D')
+
+class PhoneCheck:
+    """Результат проверки строки: нормализованный номер или причина отказа"""
+    __slots__ = ('phone', 'reason')
+
+    def __init__(self, phone=None, reason=None):
+        self.phone = phone  # 11 цифр, начиная с 7, как номер хранится в истории
+        self.reason = reason
+
+    @property
+    def ok(self) -> bool:
+        return self.phone is not None
+
+    @property
+    def e164(self):
+        return f"+{self.phone}" if self.phone else None
+
+def check_russian_phone(phone: str) -> PhoneCheck:
+    """Проверка и нормализация российского номера за один разбор строки"""
+    phone = phone.strip()
+    if not phone:
+        return PhoneCheck(reason=PHONE_EMPTY)
+    match = _PHONE_FAST.fullmatch(phone)
+    if match:
+        return PhoneCheck('7' + ''.join(match.groups()[1:]))
+    # Остальные записи: буквы недопустимы, прочие символы кроме цифр игнорируются
+    if _PHONE_LETTERS.search(phone):
+        return PhoneCheck(reason=PHONE_LETTERS)
+    phone_digits = _NON_DIGITS.sub('', phone)
+    if len(phone_digits) != 11:
+        return PhoneCheck(reason=PHONE_LENGTH)
+    if phone_digits[0] not in '78':
+        return PhoneCheck(reason=PHONE_COUNTRY)
+    return PhoneCheck('7' + phone_digits[1:])
+
+class PhoneScan:
+    """Итог проверки многострочного ввода"""
+    __slots__ = ('phones', 'invalid', 'skipped')
+
+    def __init__(self):
+        self.phones = []  # Нормализованные номера
+        self.invalid = 0  # Непустые строки, не прошедшие проверку
+        self.skipped = 0  # Корректные номера после первого, не взятые при first_only
+
+def scan_phones(text: str, first_only: bool = False) -> PhoneScan:
+    """Проверка номеров построчно; first_only - взять только первый подходящий номер.
+
+    При first_only остальные строки тоже проверяются: корректные номера
+    считаются в skipped, некорректные - в invalid.
+    """
+    scan = PhoneScan()
+    for line in text.split('\n'):
+        result = check_russian_phone(line)
+        if result.ok:
+            if first_only and scan.phones:
+                scan.skipped += 1
+            else:
+                scan.phones.append(result.phone)
+        elif result.reason != PHONE_EMPTY:
+            scan.invalid += 1
+    return scan
 
 def validate_russian_phone(phone: str) -> bool:
     """Проверка корректности российского номера телефона"""
-    # Проверяем, что строка не пустая
-    if not phone.strip():
-        return False
-    
-    # Проверяем наличие букв (если есть буквы - невалидный)
-    if re.search(r'[а-яёА-ЯЁa-zA-Z]', phone):
-        return False
-    
-    # Удаляем все символы кроме цифр и +
-    phone_clean = re.sub(r'[^\d+]', '', phone)
-    
-    # Удаляем + для подсчета цифр
-    phone_digits = re.sub(r'\D', '', phone_clean)
-    
-    # Проверяем российские номера
-    if phone_digits.startswith('8') and len(phone_digits) == 11:
-        return True
-    elif phone_digits.startswith('7') and len(phone_digits) == 11:
-        return True
-    elif phone_clean.startswith('+7') and len(phone_digits) == 11:
-        return True
-    
-    return False
\ No newline at end of file
+    return check_russian_phone(phone).ok
\ No newline at end of file
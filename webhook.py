@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на размер тела запроса: обновление Telegram заметно меньше
+MAX_BODY_SIZE = 1 << 20
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+# Сколько секунд держать соединение без нового запроса
+IDLE_TIMEOUT = 60
+# За сколько секунд клиент должен прислать заголовки и тело запроса
+READ_TIMEOUT = 10
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    408: 'Request Timeout',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+}
+
+class HttpServer:
+    """Минимальный HTTP/1.1-сервер на asyncio для коротких запросов.
+
+    Поддерживается только тело фиксированной длины (Content-Length): запрос
+    с Transfer-Encoding получает 411. Медленный клиент не держит соединение
+    бесконечно: на заголовки и тело отводится READ_TIMEOUT, на ожидание
+    следующего запроса - IDLE_TIMEOUT. Маршрутизация - в _route подкласса.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self._server = None
+
+    async def start(self, listen: str, port: int):
+        self._server = await asyncio.start_server(self._handle, listen, port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @staticmethod
+    async def _read_headers(reader) -> dict:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                try:
+                    headers = await asyncio.wait_for(self._read_headers(reader), self.read_timeout)
+                except asyncio.TimeoutError:
+                    await self._respond(writer, 408, b'')
+                    break
+                if 'transfer-encoding' in headers:
+                    await self._respond(writer, 411, b'')
+                    break
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, b'')
+                    break
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+                except asyncio.TimeoutError:
+                    await self._respond(writer, 408, b'')
+                    break
+                status, content_type, payload = await self._route(method, path.split('?', 1)[0], headers, body)
+                await self._respond(writer, status, payload, content_type)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        return 404, 'text/plain', b''
+
+    @staticmethod
+    async def _respond(writer, status: int, payload: bytes, content_type='text/plain'):
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode('latin-1') + payload
+        )
+        await writer.drain()
+
+class WebhookServer(HttpServer):
+    """Сервер вебхука: POST /<url_path> - обновления Telegram.
+
+    Обновления кладутся в update_queue приложения, как это делает встроенный
+    сервер run_webhook.
+    """
+
+    def __init__(self, application, url_path: str, secret_token: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.application = application
+        self.url_path = '/' + url_path.strip('/')
+        self.secret_token = secret_token
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        if method == 'POST' and path.rstrip('/') == self.url_path:
+            if self.secret_token and headers.get(SECRET_HEADER) != self.secret_token:
+                return 403, 'text/plain', b''
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+            except Exception as e:
+                logger.error(f"Некорректное обновление от Telegram: {e}")
+                return 400, 'text/plain', b''
+            await self.application.update_queue.put(update)
+            return 200, 'text/plain', b''
+        return 404, 'text/plain', b''
+
+class MetricsServer(HttpServer):
+    """Сервер метрик: GET /metrics в текстовом формате Prometheus.
+
+    Слушает отдельный адрес (по умолчанию только локальный), чтобы метрики
+    не были видны снаружи через открытый для Telegram порт вебхука.
+    """
+
+    def __init__(self, metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        if method == 'GET' and path == '/metrics':
+            return 200, 'text/plain; version=0.0.4; charset=utf-8', self.metrics.render_prometheus().encode('utf-8')
+        return 404, 'text/plain', b''